@@ -54,29 +54,105 @@ remote agents.
 
 import os
 import socket
+import selectors
 import http.server as server
 import threading
+import concurrent.futures
+import asyncio
 import multiprocessing
 import time
 import json
 import requests
 import queue
+import collections
 import logging
 import signal
+import struct
 import sys
 import clonemapy.datamodels as datamodels
+import clonemapy.httpclient as httpclient
 import clonemapy.ams as ams
 import clonemapy.agent as agent
 import clonemapy.logger as logger
+import clonemapy.shmqueue as shmqueue
+import clonemapy.wire as wire
+from typing import Callable
+
+MsgBatchSize = int(os.environ.get('CLONEMAP_MSG_BATCH_SIZE', 100))
+MsgBatchDelay = float(os.environ.get('CLONEMAP_MSG_BATCH_DELAY', 0))/1000
+MsgEncoding = os.environ.get('CLONEMAP_MSG_ENCODING', "json")
+ShmSize = int(os.environ.get('CLONEMAP_IPC_SHM_SIZE', 1 << 20))
+# maximum number of queued messages per remote agency and policy applied if it is reached
+# (drop-newest or drop-oldest); messages to remote agencies are never queued blocking
+PeerQueueSize = int(os.environ.get('CLONEMAP_PEER_QUEUE_SIZE', 1000))
+PeerOverflow = os.environ.get('CLONEMAP_PEER_OVERFLOW', "drop-newest")
+# media types and content encodings accepted for messages; they are advertised in the responses to
+# POST /api/agency/msgs (RFC 7694) so that remote agencies only use them once they know about them
+MsgHeaders = {"Accept-Post": "application/json, " + wire.ContentType,
+              "Accept-Encoding": ", ".join(httpclient.Encodings)}
 
 
 class AgencyHandler(server.BaseHTTPRequestHandler):
     """
     Handles http requests to the agency
+
+    Connections are kept alive (HTTP/1.1). One handler is created per connection; its requests are
+    handled one at a time by the workers of the AgencyServer. Reading a request times out after
+    CLONEMAP_AGENCY_READ_TIMEOUT seconds.
     """
+    protocol_version = "HTTP/1.1"
+    timeout = float(os.environ.get('CLONEMAP_AGENCY_READ_TIMEOUT', 5))
+    # headers and body are written separately; avoid delayed acks on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def __init__(self, request, client_address, server):
+        # requests are not handled here but dispatched by the server via handle_one_request
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = True
+        self.setup()
+
     def log_message(self, format, *args):
         return
 
+    def write_response(self, code: int, content_type: str, ret: str, headers: dict = None):
+        """
+        writes response with status code, additional headers and body
+        """
+        body = ret.encode()
+        if code == 405:
+            # request body might not have been read
+            self.close_connection = True
+        self.send_response(code)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if headers is not None:
+            for key, value in headers.items():
+                self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        """
+        reads the request body; raises ValueError if Content-Length is missing or invalid, in which
+        case the connection is closed as the body cannot be skipped
+        """
+        try:
+            content_len = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            self.close_connection = True
+            raise ValueError("Invalid Content-Length")
+        return self.rfile.read(content_len)
+
+    def write_bad_request(self, err: Exception):
+        """
+        answers a request with a malformed body
+        """
+        ret = "Bad Request: " + str(err)
+        self.write_response(400, "text/plain", ret)
+        logging.error("Agency: " + ret)
+
     def do_GET(self):
         """
         handler function for GET requests
@@ -90,6 +166,10 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
             if path[2] == "agency":
                 ret = self.handle_get_agency()
                 resvalid = True
+        elif len(path) == 4:
+            if path[2] == "agency" and path[3] == "metrics":
+                ret = self.handle_get_metrics()
+                resvalid = True
         elif len(path) == 6:
             if path[2] == "agency" and path[3] == "agents" and path[5] == "status":
                 try:
@@ -98,18 +178,15 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
                     resvalid = True
                 except ValueError:
                     pass
+                if resvalid and ret is None:
+                    self.write_response(404, "text/plain", "Resource not found")
+                    return
 
         if resvalid:
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(200, "application/json", ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(405, "text/plain", ret)
             logging.error("Agency: " + ret)
 
     def handle_get_agency(self):
@@ -122,11 +199,26 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
         ret = info.json()
         return ret
 
+    def handle_get_metrics(self):
+        """
+        handler function for GET request to /api/agency/metrics
+        """
+        return json.dumps(self.server.agency.metrics())
+
     def handle_get_agent_status(self, agentid: int):
         """
-        handler function for GET request to /api/agency/agents/{agent-id}/status
+        handler function for GET request to /api/agency/agents/{agent-id}/status; returns None if
+        the agent is not located in the agency
         """
-        stat = datamodels.Status(code=3)
+        self.server.agency.lock.acquire()
+        known = agentid in self.server.agency.local_agents
+        self.server.agency.lock.release()
+        if not known:
+            return None
+        if self.server.agency.is_ready(agentid):
+            stat = datamodels.Status(code=datamodels.StatusCode.Running)
+        else:
+            stat = datamodels.Status(code=datamodels.StatusCode.Starting)
         return stat.json()
 
     def do_POST(self):
@@ -138,65 +230,108 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
         resvalid = False
         logging.info("Agency: Received Request: POST " + self.path)
 
-        if len(path) == 4:
-            if path[2] == "agency" and path[3] == "agents":
-                self.handle_post_agent()
-                resvalid = True
-            elif path[2] == "agency" and path[3] == "msgs":
-                self.handle_post_msgs()
-                resvalid = True
-            elif path[2] == "agency" and path[3] == "msgundeliv":
-                self.handle_post_uneliv_msg()
-                resvalid = True
+        try:
+            if len(path) == 4:
+                if path[2] == "agency" and path[3] == "agents":
+                    self.handle_post_agent()
+                    resvalid = True
+                elif path[2] == "agency" and path[3] == "msgs":
+                    code = self.handle_post_msgs()
+                    if code == 201:
+                        ret = "Ressource Created"
+                    elif code == 415:
+                        ret = "Unsupported Media Type"
+                    else:
+                        ret = "Bad Request"
+                    self.write_response(code, "text/plain", ret, MsgHeaders)
+                    return
+                elif path[2] == "agency" and path[3] == "msgundeliv":
+                    self.handle_post_uneliv_msg()
+                    resvalid = True
+            elif len(path) == 5:
+                if path[2] == "agency" and path[3] == "agents" and path[4] == "list":
+                    ret = self.handle_post_agent_list()
+                    self.write_response(201, "application/json", ret)
+                    return
+        except (ValueError, TypeError, KeyError) as err:
+            # malformed body (invalid JSON or missing fields)
+            self.write_bad_request(err)
+            return
 
         if resvalid:
             ret = "Ressource Created"
-            self.send_response(201)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(201, "text/plain", ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
     def handle_post_agent(self):
         """
         handler function for post request to /api/agency/agents
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
+        body = self.read_body()
         # agentinfo_dict = json.loads(str(body, 'utf-8'))
         agentinfo = datamodels.AgentInfo.parse_raw(body, encoding='utf8')
         self.server.agency.create_agent(agentinfo)
 
-    def handle_post_msgs(self):
+    def handle_post_agent_list(self):
+        """
+        handler function for post request to /api/agency/agents/list; returns the result for each
+        agent
         """
-        handler function for post requests to /api/agency/msgs
+        body = self.read_body()
+        agentinfos = []
+        for i in json.loads(str(body, 'utf-8')):
+            agentinfos.append(datamodels.AgentInfo.parse_obj(i))
+        results = self.server.agency.create_agents(agentinfos)
+        return json.dumps(results)
+
+    def handle_post_msgs(self) -> int:
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
-        msg_dicts = json.loads(str(body, 'utf-8'))
-        msgs = []
-        for i in msg_dicts:
-            msg = datamodels.ACLMessage.parse_obj(i)
-            # msg.from_json_dict(i)
-            msgs.append(msg)
+        handler function for post requests to /api/agency/msgs; messages are either encoded as JSON
+        or with the binary encoding of the wire module and may be compressed; returns the status
+        code of the response (415 for unknown content encodings, 400 for invalid bodies)
+        """
+        body = self.read_body()
+        encoding = self.headers.get('Content-Encoding', None)
+        if encoding not in (None, "", "identity") and encoding not in httpclient.Encodings:
+            logging.error("Agency: Unsupported content encoding "+encoding)
+            return 415
+        try:
+            body = httpclient.decompress_body(body, encoding)
+            if self.headers.get('Content-Type', "") == wire.ContentType:
+                msgs = wire.decode_msgs(body)
+            else:
+                msg_dicts = json.loads(str(body, 'utf-8'))
+                msgs = []
+                for i in msg_dicts:
+                    msg = datamodels.ACLMessage.parse_obj(i)
+                    # msg.from_json_dict(i)
+                    msgs.append(msg)
+        except (ValueError, TypeError, struct.error) as err:
+            logging.error("Agency: Invalid message body: "+str(err))
+            return 400
+        undeliv = []
         for i in msgs:
             self.server.agency.lock.acquire()
             local_agent = self.server.agency.local_agents.get(i.receiver, None)
             self.server.agency.lock.release()
             if local_agent is not None:
-                local_agent.msg_in.put(i)
+                self.server.agency.deliver_local(local_agent, i)
+            else:
+                undeliv.append(i)
+        if len(undeliv) > 0:
+            self.server.agency.return_undeliverable(undeliv)
+        return 201
 
     def handle_post_uneliv_msg(self):
         """
         handler function for post request to /api/agency/msgundeliv
         """
-        pass
+        body = self.read_body()
+        msg = datamodels.ACLMessage.parse_raw(body, encoding='utf8')
+        self.server.agency.handle_undeliverable(msg)
 
     def do_PUT(self):
         """
@@ -211,31 +346,45 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
             if path[2] == "agency" and path[3] == "agents" and path[5] == "custom":
                 try:
                     agentid = int(path[4])
-                    self.handle_put_agent_custom(agentid)
-                    resvalid = True
                 except ValueError:
-                    pass
+                    agentid = None
+                if agentid is not None:
+                    try:
+                        self.handle_put_agent_custom(agentid)
+                    except ValueError as err:
+                        self.write_bad_request(err)
+                        return
+                    resvalid = True
+        elif len(path) == 4:
+            if path[2] == "agency" and path[3] == "logger":
+                try:
+                    self.handle_put_logger_config()
+                except (ValueError, TypeError) as err:
+                    self.write_bad_request(err)
+                    return
+                resvalid = True
 
         if resvalid:
             ret = "Ressource Updated"
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(200, "text/plain", ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
+    def handle_put_logger_config(self):
+        """
+        handler function for put request to /api/agency/logger
+        """
+        body = self.read_body()
+        log_config = datamodels.LoggerConfig.parse_raw(body)
+        self.server.agency.update_logger_config(log_config)
+
     def handle_put_agent_custom(self, agentid: int):
         """
         handler function for put request to /api/agency/agents/{agentid}/custom
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
+        body = self.read_body()
         custom = str(body, 'utf-8')
         self.server.agency.lock.acquire()
         handler = self.server.agency.local_agents.get(agentid, None)
@@ -264,21 +413,16 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
                     pass
 
         if resvalid:
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(200, "text/plain", ret)
         else:
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.write_response(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
     def handle_delete_agent(self, agentid: int):
         """
         handler function for delete request to /api/agency/agents/{agent-id}
         """
+        others = []
         self.server.agency.lock.acquire()
         handler = self.server.agency.local_agents.get(agentid, None)
         if handler is None:
@@ -287,21 +431,266 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
             deleted = False
             msg = "Resource not found"
         else:
-            handler.proc.terminate()
+            if handler.stop(agentid):
+                self.server.agency.free_slot(handler.slot)
             del self.server.agency.local_agents[agentid]
+            with self.server.agency.ready_cond:
+                self.server.agency.ready_agents.discard(agentid)
             deleted = True
             msg = "Resource deleted"
+            for i in self.server.agency.local_agents:
+                others.append((i, self.server.agency.local_agents[i]))
         self.server.agency.lock.release()
+        # remove agent from the local agents known by the other agents
+        for i, other in others:
+            ctrl = datamodels.ACLMessage(receiver=i, sender=-1, prot=-2, content=str(agentid))
+            other.msg_in.put(ctrl)
         return deleted, msg
 
 
+class AddressCache:
+    """
+    Cache for the agencies of remote agents
+
+    The cache holds at most maxsize entries; the least recently used entry is evicted if the cache
+    is full. Entries older than ttl seconds are discarded (no expiry if ttl is 0). The cache is not
+    thread-safe; it is protected by the lock of the agency.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __contains__(self, agentid: int) -> bool:
+        return agentid in self._entries
+
+    def get(self, agentid: int) -> str:
+        """
+        returns the agency of agent or None if unknown
+        """
+        entry = self._entries.get(agentid, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self._ttl > 0 and entry[1] < time.monotonic():
+            del self._entries[agentid]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(agentid)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, agentid: int, agency: str):
+        """
+        stores agency of agent
+        """
+        self._entries[agentid] = (agency, time.monotonic() + self._ttl)
+        self._entries.move_to_end(agentid)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, agentid: int, agency: str):
+        """
+        removes the entry of agent if it points to agency
+        """
+        entry = self._entries.get(agentid, None)
+        if entry is not None and entry[0] == agency:
+            del self._entries[agentid]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+class AgencyServer(server.HTTPServer):
+    """
+    http server which handles single requests in one of a fixed number of worker threads; new
+    connections and keep-alive connections between two requests are watched by a selector such
+    that idle connections do not occupy a worker; new connections without a request within the
+    read timeout of the handler and keep-alive connections idle for more than keepalive seconds
+    are closed; workers are daemon threads such that they do not delay termination
+    """
+    request_queue_size = 128
+
+    def __init__(self, address, handler, workers: int, keepalive: float):
+        super().__init__(address, handler)
+        self._keepalive = keepalive
+        self._requests = queue.Queue()
+        self._parked = queue.Queue()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_in, self._wakeup_out = socket.socketpair()
+        self._wakeup_in.setblocking(False)
+        self._selector.register(self._wakeup_in, selectors.EVENT_READ, None)
+        for i in range(workers):
+            x = threading.Thread(target=self._worker, daemon=True)
+            x.start()
+        x = threading.Thread(target=self._watch, daemon=True)
+        x.start()
+
+    def process_request(self, request, client_address):
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._park(handler, handler.timeout)
+
+    def _park(self, handler, timeout: float):
+        """
+        hands a connection to the selector until the next request arrives or timeout expires
+        """
+        self._parked.put((handler, timeout))
+        self._wakeup_out.send(b"\0")
+
+    def _worker(self):
+        while True:
+            handler = self._requests.get()
+            try:
+                handler.close_connection = True
+                handler.handle_one_request()
+                if not handler.close_connection:
+                    if self._buffered(handler):
+                        # pipelined request has already been read from the socket
+                        self._requests.put(handler)
+                    else:
+                        self._park(handler, self._keepalive)
+                    continue
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+            self._close(handler)
+
+    def _buffered(self, handler) -> bool:
+        """
+        returns True if data of the next request is available without blocking
+        """
+        handler.request.settimeout(0)
+        try:
+            return len(handler.rfile.peek(1)) > 0
+        except OSError:
+            return False
+        finally:
+            handler.request.settimeout(handler.timeout)
+
+    def _close(self, handler):
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def _watch(self):
+        """
+        waits for requests on new and idle keep-alive connections and hands readable connections to
+        the workers
+        """
+        deadlines = {}
+        while True:
+            events = self._selector.select(1)
+            for key, _ in events:
+                if key.fileobj is self._wakeup_in:
+                    try:
+                        self._wakeup_in.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._selector.unregister(key.fileobj)
+                deadlines.pop(key.data, None)
+                self._requests.put(key.data)
+            while True:
+                try:
+                    handler, timeout = self._parked.get(block=False)
+                except queue.Empty:
+                    break
+                try:
+                    self._selector.register(handler.request, selectors.EVENT_READ, handler)
+                except (ValueError, OSError):
+                    self._close(handler)
+                    continue
+                deadlines[handler] = time.monotonic() + timeout
+            now = time.monotonic()
+            expired = [i for i in deadlines if deadlines[i] < now]
+            for handler in expired:
+                del deadlines[handler]
+                self._selector.unregister(handler.request)
+                self._close(handler)
+
+
 class AgentHandler:
     """
-    Contains the queue for incoming messages of local agents
+    Contains the queue for incoming messages of local agents and the process or worker executing
+    the agent as well as the slot of the agent in the overflow counters of the agency (-1 if none)
     """
-    def __init__(self):
+    def __init__(self, ctx, worker=None, slot: int = -1):
+        super().__init__()
+        self.worker = worker
+        self.slot = slot
+        self.proc = None
+        if worker is None:
+            self.msg_in = new_ipc_queue(ctx, "MSG_IN", 100)
+        else:
+            self.msg_in = worker.msg_in
+            worker.num_agents += 1
+
+    def stop(self, agentid: int) -> bool:
+        """
+        stops the agent; returns False if the agent is executed by a worker and stops
+        asynchronously, in which case the worker reports the end of the agent via the ready queue
+        of the agency before the slot may be reused
+        """
+        if self.worker is not None:
+            self.worker.stop_agent(agentid)
+            return False
+        if self.proc is not None:
+            self.proc.terminate()
+        close_ipc_queue(self.msg_in)
+        return True
+
+
+class AgentWorker:
+    """
+    Process which executes several agents (one thread per agent task)
+
+    Attributes
+    ----------
+    index : integer
+            index of worker within the agency
+    msg_in : multiprocessing.Queue or shmqueue.ShmQueue
+             queue for incoming messages of all agents executed by the worker
+    ctrl : multiprocessing.Queue
+           queue for commands to the worker (start and stop of agents)
+    num_agents : integer
+                 number of agents assigned to the worker
+    """
+    def __init__(self, ctx, index: int):
         super().__init__()
-        self.msg_in = multiprocessing.Queue(100)
+        self.index = index
+        self.msg_in = new_ipc_queue(ctx, "MSG_IN", 1000)
+        self.ctrl = ctx.Queue()
+        self.num_agents = 0
+        self.proc = None
+
+    def start_agent(self, agentinfo: datamodels.AgentInfo, local: dict, slot: int):
+        """
+        starts agent in worker; local maps the IDs of all local agents to the index of their worker
+        and their slot
+        """
+        self.ctrl.put(("start", agentinfo, local, slot))
+
+    def stop_agent(self, agentid: int):
+        """
+        stops delivery of messages to agent and makes the agent end its threads
+        """
+        self.num_agents -= 1
+        self.ctrl.put(("stop", agentid))
 
 
 class Agency:
@@ -309,12 +698,17 @@ class Agency:
     Handles the http REST API and manages the agents as well as messaging among agents
 
     Following threads are started
-    - one thread for http server
+    - one thread for http server and a pool of threads handling its connections
     - one thread for sending of logs
-    - one thread for each remote agency for sending of messages
+    - one thread for each remote agency for sending of messages and a pool of threads requesting
+      agent addresses from the ams; if CLONEMAP_AGENCY_RUNTIME is set to asyncio, both is done by
+      the AsyncRuntime instead
 
     Following processes are started:
-    - one process for each agent
+    - one process for each agent and CLONEMAP_WARM_POOL idle processes for agents created at
+      runtime; if CLONEMAP_AGENT_WORKERS is set to a number (or auto for the
+      number of cores), a fixed number of worker processes is started instead which execute the
+      agents
 
     Attributes
     ----------
@@ -325,32 +719,92 @@ class Agency:
                seperate process
     local_agents : dictionary of AgentHandler
                    each local agent has a queue for incoming messages; this is stored in its handler
-    msg_out : multiprocessing.Queue
+    msg_out : multiprocessing.Queue or shmqueue.ShmQueue
               queue for outgoing messages
-    log_out : multiprocessing.Queue
+    log_out : multiprocessing.Queue or shmqueue.ShmQueue
               queue for outgoing log messages
-    ts_out : multiprocessing.Queue
+    ts_out : multiprocessing.Queue or shmqueue.ShmQueue
               queue for outgoing timeseries data
+    log_shipper : logger.LogShipper
+                  sends the logs of log_out to the logger in batches
+    state_publisher : logger.StatePublisher
+                      sends the latest states of the agents to the logger in regular intervals
+    ts_shipper : logger.TimeSeriesShipper
+                 buffers the samples of ts_out and sends them to the logger in batches
+    log_flags : multiprocessing.RawArray
+                enabled log topics and limits for msg logs shared with the agents; logs of disabled
+                topics are discarded within the agent processes
+    suppressed : dict of int
+                 number of suppressed msg logs per agent already reported
+    counters : multiprocessing.RawArray
+               counters of dropped and delayed logs, timeseries samples and messages of each agent
+               (see agent.Counters); the counters are written without synchronization
+    free_slots : list of int
+                 unused slots in counters
+    mp : multiprocessing context
+         context used to create agent processes and queues
+    ready : multiprocessing.Queue
+            queue in which agents report their readiness
+    ready_agents : set
+                   IDs of agents that are ready
     lock : multiprocessing.Lock
            lock to protect variables from concurrent access
-    remote_agents : dictionary of queue.Queue
-                    stores the outgoing queue of remote (non-local) agents
-    remote_agencies : dictionary of queue.Queue
+    remote_agents : AddressCache
+                    stores the agency of remote (non-local) agents
+    parked : dictionary of list of datamodels.ACLMessage
+             messages to remote agents whose address is being requested from the ams
+    remote_agencies : dictionary of RemoteAgency or AsyncRemoteAgency
                       stores the outgoing queue of remote agencies (sending to each remote agency is
-                      handled in a seperate thread)
+                      handled in a seperate thread or by the runtime)
+    pool : list of AgentHandler
+           idle agent processes (warm pool) used for agents created at runtime
+    workers : list of AgentWorker
+              worker processes executing the agents; empty if one process per agent is used
+    runtime : AsyncRuntime
+              asyncio runtime for outgoing traffic; None if threads are used
+    resolver : concurrent.futures.ThreadPoolExecutor
+               thread pool for address requests to the ams; None if runtime is used
     """
     def __init__(self, ag_class: agent.Agent):
         super().__init__()
         signal.signal(signal.SIGINT, self.terminate)
         signal.signal(signal.SIGTERM, self.terminate)
         self.ag_class = ag_class
+        self.mp = new_mp_context()
         self.local_agents = {}
-        self.msg_out = multiprocessing.Queue(1000)
-        self.log_out = multiprocessing.Queue(1000)
-        self.ts_out = multiprocessing.Queue(1000)
+        self.workers = []
+        self.pool = []
+        self.pool_size = int(os.environ.get('CLONEMAP_WARM_POOL', 0))
+        self.pool_event = threading.Event()
+        self.msg_out = new_ipc_queue(self.mp, "MSG_OUT", 1000)
+        self.log_out = new_ipc_queue(self.mp, "LOG_OUT", 1000)
+        self.ts_out = new_ipc_queue(self.mp, "TS_OUT", 1000)
+        self.log_shipper = None
+        self.ts_shipper = None
+        self.state_publisher = None
+        self.log_flags = self.mp.RawArray('d', agent.NumLogFlags)
+        agent.set_log_flags(self.log_flags, datamodels.LoggerConfig(msg=True, app=True,
+                                                                    status=True, debug=True))
+        self.suppressed = {}
+        max_agents = int(os.environ.get('CLONEMAP_MAX_AGENTS', 1024))
+        self.counters = self.mp.RawArray('q', max_agents * len(agent.Counters))
+        self.free_slots = list(range(max_agents))
+        self.ready = self.mp.Queue()
+        self.ready_agents = set()
+        self.ready_cond = threading.Condition()
         self.lock = multiprocessing.Lock()
-        self.remote_agents = {}
+        cache_size = int(os.environ.get('CLONEMAP_ADDRESS_CACHE_SIZE', 10000))
+        cache_ttl = float(os.environ.get('CLONEMAP_ADDRESS_CACHE_TTL', 600))
+        self.remote_agents = AddressCache(cache_size, cache_ttl)
         self.remote_agencies = {}
+        self.parked = {}
+        self.runtime = None
+        self.resolver = None
+        if os.environ.get('CLONEMAP_AGENCY_RUNTIME', "thread") == "asyncio":
+            self.runtime = AsyncRuntime()
+        else:
+            workers = int(os.environ.get('CLONEMAP_RESOLVE_WORKERS', 4))
+            self.resolver = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
         try:
             log_type = os.environ['CLONEMAP_LOG_LEVEL']
             if log_type == "info":
@@ -380,6 +834,7 @@ class Agency:
         if conf.name != "":
             # self.info.id = conf.id
             self.logger_config = conf.logger
+            agent.set_log_flags(self.log_flags, self.logger_config)
             self.mas_name = conf.masname
             self.mas_custom = conf.mascustom
             self.info.agents = conf.agents
@@ -387,18 +842,40 @@ class Agency:
             logging.error("Agency: Received invalid agency info from AMS")
             return
 
+        if os.environ.get('CLONEMAP_ADDRESS_PREFETCH', "OFF") == "ON":
+            if self.runtime is not None:
+                self.runtime.run(self.prefetch_addresses)
+            else:
+                self.resolver.submit(self.prefetch_addresses)
         x = threading.Thread(target=self.send_msg, daemon=True)
         x.start()
-        y = threading.Thread(target=logger.send_logs,
-                             args=(self.info.masid, self.logger_config, self.log_out,),
-                             daemon=True)
+        self.state_publisher = logger.StatePublisher(self.info.masid)
+        if os.environ['CLONEMAP_LOGGING'] == "ON":
+            y = threading.Thread(target=self.state_publisher.run, daemon=True)
+            y.start()
+        self.log_shipper = logger.LogShipper(self.info.masid, self.logger_config, self.log_out,
+                                             self.state_publisher)
+        y = threading.Thread(target=self.log_shipper.run, daemon=True)
         y.start()
-        y = threading.Thread(target=logger.send_timeseries_data,
-                             args=(self.info.masid, self.ts_out,),
-                             daemon=True)
+        self.ts_shipper = logger.TimeSeriesShipper(self.info.masid, self.ts_out)
+        y = threading.Thread(target=self.ts_shipper.run, daemon=True)
         y.start()
+        y = threading.Thread(target=self.receive_ready, daemon=True)
+        y.start()
+        y = threading.Thread(target=self.report_suppressed, daemon=True)
+        y.start()
+        num_workers = os.environ.get('CLONEMAP_AGENT_WORKERS', "0")
+        if num_workers == "auto":
+            num_workers = os.cpu_count()
+        if int(num_workers) > 0:
+            self.start_workers(int(num_workers))
         self.start_agents()
-        time.sleep(2)
+        if self.pool_size > 0 and len(self.workers) == 0:
+            y = threading.Thread(target=self.fill_pool, daemon=True)
+            y.start()
+        timeout = float(os.environ.get('CLONEMAP_START_TIMEOUT', 60))
+        if not self.wait_ready([i.id for i in self.info.agents], timeout):
+            logging.error("Agency: Not all agents ready after "+str(timeout)+" seconds")
         self.listen()
 
     def start_agents(self):
@@ -406,36 +883,211 @@ class Agency:
         Requests the agent configuration from the ams and starts the agents
         """
         logging.info("Agency: Starting agents")
-        for i in self.info.agents:
-            self.create_agent(i)
+        self.create_agents(self.info.agents)
 
-    def create_agent(self, agentinfo: datamodels.AgentInfo):
+    def create_agents(self, agentinfos: list) -> list:
         """
-        executes agent in seperate process
+        starts several agents in parallel (CLONEMAP_START_PARALLEL threads); returns a list with
+        the id, the status code (201 or 409 if the agent exists already) and an error description
+        for each agent
         """
-        # make child process handle signals with default handler
-        signal.signal(signal.SIGINT, signal.SIG_DFL)
-        signal.signal(signal.SIGTERM, signal.SIG_DFL)
-        ag_handler = AgentHandler()
-        p = multiprocessing.Process(target=agent_starter, args=(self.ag_class, agentinfo,
-                                    self.mas_name, self.mas_custom,
-                                    ag_handler.msg_in, self.msg_out, self.log_out, self.ts_out,))
-        p.start()
-        ag_handler.proc = p
+        # handlers of all agents are created beforehand such that each agent knows the incoming
+        # queues of all other local agents
+        handlers = {}
+        results = []
         self.lock.acquire()
-        self.local_agents[agentinfo.id] = ag_handler
+        for i in agentinfos:
+            if i.id in self.local_agents:
+                results.append({'id': i.id, 'code': 409, 'error': "agent exists"})
+                continue
+            handlers[i.id] = self.new_agent_handler()
+            self.local_agents[i.id] = handlers[i.id]
+            results.append({'id': i.id, 'code': 201, 'error': ""})
         self.lock.release()
-        # reset signal handler
-        signal.signal(signal.SIGINT, self.terminate)
-        signal.signal(signal.SIGTERM, self.terminate)
+        parallel = int(os.environ.get('CLONEMAP_START_PARALLEL', 8))
+        futures = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as pool:
+            for i in agentinfos:
+                if i.id in handlers:
+                    futures[i.id] = pool.submit(self.create_agent, i, handlers[i.id])
+        for i in results:
+            fut = futures.get(i['id'], None)
+            if fut is not None and fut.exception() is not None:
+                logging.error("Agency: Error starting agent "+str(i['id'])+": " +
+                              str(fut.exception()))
+                i['code'] = 500
+                i['error'] = str(fut.exception())
+        return results
+
+    def receive_ready(self):
+        """
+        receives the readiness notifications of agents and the notifications of workers that a
+        stopped agent has ended, i.e. its slot can be reused
+        """
+        while True:
+            agentid = self.ready.get()
+            if isinstance(agentid, tuple):
+                self.lock.acquire()
+                self.free_slot(agentid[1])
+                self.lock.release()
+                continue
+            with self.ready_cond:
+                self.ready_agents.add(agentid)
+                self.ready_cond.notify_all()
+
+    def wait_ready(self, agentids: list, timeout: float) -> bool:
+        """
+        waits until all agents in agentids are ready; returns False after timeout seconds
+        """
+        with self.ready_cond:
+            return self.ready_cond.wait_for(lambda: self.ready_agents.issuperset(agentids),
+                                            timeout)
+
+    def is_ready(self, agentid: int) -> bool:
+        with self.ready_cond:
+            return agentid in self.ready_agents
+
+    def start_workers(self, num: int):
+        """
+        starts the worker processes which execute the agents
+        """
+        logging.info("Agency: Starting "+str(num)+" workers")
+        for i in range(num):
+            self.workers.append(AgentWorker(self.mp, i))
+        msg_ins = []
+        for i in self.workers:
+            msg_ins.append(i.msg_in)
+        for i in self.workers:
+            i.proc = self.mp.Process(target=worker_starter,
+                                     args=(self.ag_class, self.mas_name, self.mas_custom, i.index,
+                                           msg_ins, i.ctrl, self.msg_out, self.log_out,
+                                           self.ts_out, self.ready, self.log_flags,
+                                           self.counters,))
+            i.proc.start()
+
+    def new_agent_handler(self) -> AgentHandler:
+        """
+        creates handler for a new agent; if workers are used, the agent is assigned to the worker
+        with the least agents; to be called with locked lock
+        """
+        if len(self.workers) == 0:
+            return AgentHandler(self.mp, slot=self.new_slot())
+        worker = self.workers[0]
+        for i in self.workers:
+            if i.num_agents < worker.num_agents:
+                worker = i
+        return AgentHandler(self.mp, worker, self.new_slot())
+
+    def new_slot(self) -> int:
+        """
+        returns an unused slot in the overflow counters or -1 if all slots are used; to be called
+        with locked lock
+        """
+        if len(self.free_slots) == 0:
+            return -1
+        return self.free_slots.pop()
+
+    def free_slot(self, slot: int):
+        """
+        resets the counters of the slot and marks it as unused; to be called with locked lock
+        """
+        if slot < 0:
+            return
+        num = len(agent.Counters)
+        for i in range(num):
+            self.counters[slot*num + i] = 0
+        self.free_slots.append(slot)
+
+    def deliver_local(self, ag_handler: AgentHandler, msg: datamodels.ACLMessage):
+        """
+        puts message into the incoming queue of a local agent according to CLONEMAP_MSG_OVERFLOW
+        """
+        index = -1
+        if ag_handler.slot >= 0:
+            index = ag_handler.slot*len(agent.Counters) + agent.Counters["msg_dropped"]
+        # agents executed by a worker share its incoming queue
+        shared = ag_handler.worker is not None
+        if not agent.enqueue(ag_handler.msg_in, msg, agent.MsgOverflow, self.counters, index,
+                             shared):
+            logging.info("Agency: Dropped message to agent "+str(msg.receiver))
+
+    def create_agent(self, agentinfo: datamodels.AgentInfo, ag_handler: AgentHandler = None):
+        """
+        executes agent in seperate process or in a worker; may be called from any thread
+        """
+        self.lock.acquire()
+        if ag_handler is None and len(self.workers) == 0 and len(self.pool) > 0:
+            # use idle process of warm pool
+            ag_handler = self.pool.pop(0)
+            self.local_agents[agentinfo.id] = ag_handler
+            known = list(self.local_agents.keys())
+            self.lock.release()
+            ag_handler.start.put((agentinfo, known))
+            self.pool_event.set()
+            logging.info("Agency: Started agent "+str(agentinfo.id)+" from warm pool")
+            return
+        if ag_handler is None:
+            ag_handler = self.new_agent_handler()
+            self.local_agents[agentinfo.id] = ag_handler
+        local = {}
+        for i in self.local_agents:
+            handler = self.local_agents[i]
+            if ag_handler.worker is None:
+                local[i] = (handler.msg_in, handler.slot, False)
+            elif handler.worker is not None:
+                local[i] = (handler.worker.index, handler.slot)
+        self.lock.release()
+        if ag_handler.worker is not None:
+            ag_handler.worker.start_agent(agentinfo, local, ag_handler.slot)
+            logging.info("Agency: Started agent "+str(agentinfo.id)+" in worker " +
+                         str(ag_handler.worker.index))
+            return
+        p = self.mp.Process(target=agent_starter, args=(self.ag_class, agentinfo,
+                            self.mas_name, self.mas_custom,
+                            ag_handler.msg_in, self.msg_out, self.log_out, self.ts_out,
+                            self.ready, local, self.log_flags, self.counters,
+                            ag_handler.slot,))
+        p.start()
+        ag_handler.proc = p
         logging.info("Agency: Started agent "+str(agentinfo.id))
 
+    def fill_pool(self):
+        """
+        keeps CLONEMAP_WARM_POOL idle agent processes which are used for agents created at runtime
+        """
+        while True:
+            self.lock.acquire()
+            num = len(self.pool)
+            local = {}
+            for i in self.local_agents:
+                local[i] = (self.local_agents[i].msg_in, self.local_agents[i].slot, False)
+            self.lock.release()
+            if num >= self.pool_size:
+                self.pool_event.wait()
+                self.pool_event.clear()
+                continue
+            self.lock.acquire()
+            ag_handler = AgentHandler(self.mp, slot=self.new_slot())
+            self.lock.release()
+            ag_handler.start = self.mp.Queue(1)
+            p = self.mp.Process(target=idle_agent_starter, args=(self.ag_class, self.mas_name,
+                                self.mas_custom, ag_handler.msg_in, self.msg_out, self.log_out,
+                                self.ts_out, self.ready, ag_handler.start, local,
+                                self.log_flags, self.counters, ag_handler.slot,))
+            p.start()
+            ag_handler.proc = p
+            self.lock.acquire()
+            self.pool.append(ag_handler)
+            self.lock.release()
+
     def listen(self):
         """
-        open http server
+        open http server; the number of concurrently handled requests is limited by
+        CLONEMAP_AGENCY_WORKERS; idle connections are closed after CLONEMAP_AGENCY_KEEPALIVE seconds
         """
-        serv = server.HTTPServer
-        self.httpd = serv(('', 10000), AgencyHandler)
+        workers = int(os.environ.get('CLONEMAP_AGENCY_WORKERS', 16))
+        keepalive = float(os.environ.get('CLONEMAP_AGENCY_KEEPALIVE', 30))
+        self.httpd = AgencyServer(('', 10000), AgencyHandler, workers, keepalive)
         self.httpd.agency = self
         self.httpd.serve_forever()
 
@@ -443,81 +1095,705 @@ class Agency:
         """
         send messages from local agents
         """
-        self.lock.acquire()
-        masid = self.info.masid
-        self.lock.release()
         while True:
             msg = self.msg_out.get()
             recv = msg.receiver
             msg.agencys = self.info.name
-            log = datamodels.LogMessage(masid=masid, agentid=msg.sender, topic="msg",
-                                        msg="ACL send", data=str(msg))
             self.lock.acquire()
             local_agent = self.local_agents.get(recv, None)
-            recv_agency = self.remote_agents.get(recv, None)
+            recv_agency = self.remote_agents.get(recv)
             self.lock.release()
             if local_agent is not None:
                 # agent is local -> add message to its queue
-                local_agent.msg_in.put(msg)
-                self.log_out.put(log)
-                continue
+                self.deliver_local(local_agent, msg)
             elif recv_agency is None:
-                # agent is non-local, but address of agent is unknown -> request agent address
-                addr = ams.get_agent_address("ams:9000", masid, recv)
-                if addr.agency == "":
-                    logging.error("Agency: Invalid agent address for agent "+str(recv))
-                    continue
-                self.lock.acquire()
-                # check if agency of remote agent is known
-                agency = self.remote_agencies.get(addr.agency, None)
-                self.lock.release()
-                if agency is None:
-                    # remote agency is not known -> create a queue for messages to this agency and
-                    # start a sender in a new thread
-                    agency = queue.Queue(1000)
-                    self.lock.acquire()
-                    self.remote_agencies[addr.agency] = agency
-                    self.lock.release()
-                    y = threading.Thread(target=remote_agency_sender, args=(addr.agency, agency,),
-                                         daemon=True)
-                    y.start()
-                self.lock.acquire()
-                self.remote_agents[recv] = agency
+                # agent is non-local, but address of agent is unknown -> park message until
+                # address is resolved
+                self.park_msg(msg)
+            else:
+                # add message to queue of remote agency
+                self.get_remote_agency(recv_agency).put(msg)
+
+    def park_msg(self, msg: datamodels.ACLMessage, stale: str = ""):
+        """
+        stores message until the address of the receiver is resolved; the address is requested from
+        the ams if no request for the same agent is pending; stale is an agency the message could
+        not be delivered to
+        """
+        recv = msg.receiver
+        self.lock.acquire()
+        parked = self.parked.get(recv, None)
+        if parked is not None:
+            parked.append(msg)
+            self.lock.release()
+            return
+        # the address might have been published since the caller looked it up; sending the message
+        # is then necessary to keep its order with later messages sent to the published address
+        recv_agency = self.remote_agents.get(recv)
+        if recv_agency is not None and recv_agency != stale:
+            self.lock.release()
+            self.get_remote_agency(recv_agency).put(msg)
+            return
+        self.parked[recv] = [msg]
+        self.lock.release()
+        if self.runtime is not None:
+            self.runtime.run(self.resolve_address, recv, stale)
+        else:
+            self.resolver.submit(self.resolve_address, recv, stale)
+
+    def resolve_address(self, agentid: int, stale: str = ""):
+        """
+        requests the address of a remote agent from the ams and sends all messages parked for this
+        agent; executed in the resolver pool or in the runtime; if the agent is still located in
+        the stale agency, the parked messages are dropped
+        """
+        try:
+            addr = ams.get_agent_address("ams:9000", self.info.masid, agentid)
+        except Exception as err:
+            logging.error("Agency: Error requesting address of agent "+str(agentid)+": "+str(err))
+            addr = None
+        if addr is not None and addr.agency is not None and addr.agency == stale:
+            logging.error("Agency: Agency "+stale+" of agent "+str(agentid)+" not reachable")
+            addr = None
+        if addr is None or addr.agency is None or addr.agency == "":
+            logging.error("Agency: Invalid agent address for agent "+str(agentid))
+            self.lock.acquire()
+            msgs = self.parked.pop(agentid, [])
+            self.lock.release()
+            logging.error("Agency: Dropped "+str(len(msgs))+" messages to agent "+str(agentid))
+            return
+        agency = self.get_remote_agency(addr.agency)
+        while True:
+            # messages parked while sending are sent before the address is published to keep the
+            # order of messages
+            self.lock.acquire()
+            msgs = self.parked[agentid]
+            if len(msgs) == 0:
+                del self.parked[agentid]
+                self.remote_agents.put(agentid, addr.agency)
                 self.lock.release()
-                recv_agency = agency
-            # add message to queue of remote agent
-            recv_agency.put(msg)
-            self.log_out.put(log)
+                break
+            self.parked[agentid] = []
+            self.lock.release()
+            for i in msgs:
+                agency.put(i)
+
+    def prefetch_addresses(self):
+        """
+        requests the addresses of all agents in the mas from the ams
+        """
+        try:
+            agents = ams.get_agents("ams:9000", self.info.masid)
+        except Exception as err:
+            logging.error("Agency: Error requesting agents of MAS: "+str(err))
+            return
+        if agents is None:
+            return
+        self.lock.acquire()
+        for i in agents.instances:
+            if i.address.agency is None or i.address.agency in ("", self.info.name):
+                continue
+            if i.id not in self.remote_agents:
+                self.remote_agents.put(i.id, i.address.agency)
+        self.lock.release()
+        logging.info("Agency: Prefetched addresses of "+str(len(agents.instances))+" agents")
+
+    def handle_failed_msgs(self, address: str, msgs: list):
+        """
+        invalidates the addresses of the receivers of messages that could not be sent to a remote
+        agency and sends the messages again after their addresses are resolved
+        """
+        self.lock.acquire()
+        for i in msgs:
+            self.remote_agents.invalidate(i.receiver, address)
+        self.lock.release()
+        for i in msgs:
+            self.park_msg(i, address)
+
+    def handle_undeliverable(self, msg: datamodels.ACLMessage):
+        """
+        handles a message returned by a remote agency because the receiver is not located there
+        """
+        logging.info("Agency: Message to agent "+str(msg.receiver)+" undeliverable by agency " +
+                     msg.agencyr)
+        self.handle_failed_msgs(msg.agencyr, [msg])
+
+    def return_undeliverable(self, msgs: list):
+        """
+        returns messages for agents which are not located in this agency to the sending agencies
+        """
+        for i in msgs:
+            logging.error("Agency: Received message for unknown agent "+str(i.receiver))
+            if i.agencys == "":
+                continue
+            if self.runtime is not None:
+                self.runtime.run(post_undeliverable, i.agencys, i)
+            else:
+                self.resolver.submit(post_undeliverable, i.agencys, i)
+
+    def get_remote_agency(self, address: str):
+        """
+        returns the queue for messages to a remote agency; the sender is created if it does not
+        exist
+        """
+        self.lock.acquire()
+        agency = self.remote_agencies.get(address, None)
+        if agency is None:
+            agency = self.new_remote_agency(address)
+            self.remote_agencies[address] = agency
+        self.lock.release()
+        return agency
+
+    def new_remote_agency(self, address: str):
+        """
+        creates the sender for messages to a remote agency and returns the queue to be used for
+        messages to this agency; the sender is either executed in a new thread or in the asyncio
+        runtime; to be called with locked lock
+        """
+        if self.runtime is not None:
+            return self.runtime.new_sender(address, self.handle_failed_msgs)
+        return RemoteAgency(address, self.handle_failed_msgs)
+
+    def update_logger_config(self, log_config: datamodels.LoggerConfig):
+        """
+        updates the enabled log topics of the agency and all agents
+        """
+        self.logger_config = log_config
+        if self.log_shipper is not None:
+            self.log_shipper.log_config = log_config
+        agent.set_log_flags(self.log_flags, log_config)
+        logging.info("Agency: Updated logger config")
+
+    def report_suppressed(self):
+        """
+        logs the number of msg logs suppressed by rate limiting or sampling of each agent every
+        CLONEMAP_LOG_SUMMARY_INTERVAL seconds
+        """
+        interval = float(os.environ.get('CLONEMAP_LOG_SUMMARY_INTERVAL', 10))
+        index = agent.Counters["msg_log_suppressed"]
+        num = len(agent.Counters)
+        while True:
+            time.sleep(interval)
+            summaries = []
+            self.lock.acquire()
+            reported = {}
+            for i in self.local_agents:
+                slot = self.local_agents[i].slot
+                if slot < 0:
+                    continue
+                value = self.counters[slot*num + index]
+                last = self.suppressed.get(i, 0)
+                if value < last:
+                    # counters have been reset for a new agent with the same id
+                    last = 0
+                if value > last:
+                    summaries.append((i, value - last))
+                reported[i] = value
+            self.suppressed = reported
+            self.lock.release()
+            for i, count in summaries:
+                log = datamodels.LogMessage(masid=self.info.masid, agentid=i, topic="msg",
+                                            msg="Logs suppressed",
+                                            data=str(count)+" records suppressed")
+                agent.enqueue(self.log_out, log, "drop-newest")
+
+    def overflow_stats(self) -> dict:
+        """
+        returns the overflow counters of all local agents with dropped or delayed items
+        """
+        ret = {}
+        num = len(agent.Counters)
+        self.lock.acquire()
+        for i in self.local_agents:
+            slot = self.local_agents[i].slot
+            if slot < 0:
+                continue
+            values = self.counters[slot*num:(slot+1)*num]
+            if any(values):
+                ret[i] = {}
+                for name in agent.Counters:
+                    ret[i][name] = values[agent.Counters[name]]
+        self.lock.release()
+        return ret
+
+    def metrics(self) -> dict:
+        """
+        returns runtime metrics of the agency
+        """
+        ret = {}
+        ret['http'] = httpclient.stats()
+        self.lock.acquire()
+        ret['addresses'] = self.remote_agents.stats()
+        self.lock.release()
+        if self.log_shipper is not None:
+            ret['logs'] = self.log_shipper.stats()
+        if self.ts_shipper is not None:
+            ret['timeseries'] = self.ts_shipper.stats()
+        if self.state_publisher is not None:
+            ret['states'] = self.state_publisher.stats()
+        ret['overflow'] = self.overflow_stats()
+        peers = {}
+        self.lock.acquire()
+        for i in self.remote_agencies:
+            peers[i] = {'dropped': self.remote_agencies[i].dropped}
+        self.lock.release()
+        ret['peers'] = peers
+        return ret
 
     def terminate(self, sig, frame):
         for i in self.local_agents:
-            self.local_agents[i].proc.terminate()
+            self.local_agents[i].stop(i)
             logging.info("Agency: Stopped agent " + str(i))
+        for i in self.workers:
+            i.proc.terminate()
+            close_ipc_queue(i.msg_in)
+        for i in self.pool:
+            i.stop(-1)
+        if self.log_shipper is not None:
+            timeout = float(os.environ.get('CLONEMAP_LOG_FLUSH_TIMEOUT', 5))
+            if not self.log_shipper.stop(timeout):
+                logging.error("Agency: Pending logs could not be sent")
+        if self.ts_shipper is not None:
+            timeout = float(os.environ.get('CLONEMAP_LOG_FLUSH_TIMEOUT', 5))
+            if not self.ts_shipper.stop(timeout):
+                logging.error("Agency: Pending timeseries data could not be sent")
+        if self.state_publisher is not None and os.environ['CLONEMAP_LOGGING'] == "ON":
+            timeout = float(os.environ.get('CLONEMAP_LOG_FLUSH_TIMEOUT', 5))
+            if not self.state_publisher.stop(timeout):
+                logging.error("Agency: Pending agent states could not be sent")
+        close_ipc_queue(self.msg_out)
+        close_ipc_queue(self.log_out)
+        close_ipc_queue(self.ts_out)
         sys.exit(0)
 
 
-def remote_agency_sender(address: str, out: queue.Queue):
+def new_mp_context():
     """
-    sender to remote agency; executed in seperate thread
+    returns the multiprocessing context used for agent processes; the start method is configured
+    with CLONEMAP_START_METHOD (fork, forkserver or spawn); the forkserver preloads the modules
+    needed by agents
+    """
+    method = os.environ.get('CLONEMAP_START_METHOD', "fork")
+    ctx = multiprocessing.get_context(method)
+    if method == "forkserver":
+        ctx.set_forkserver_preload(["clonemapy.agent", "clonemapy.datamodels", "clonemapy.wire",
+                                    "paho.mqtt.client", "pydantic"])
+    return ctx
+
+
+def new_ipc_queue(ctx, channel: str, maxsize: int):
+    """
+    creates a queue for the communication with agent processes; if CLONEMAP_IPC_<channel> is set to
+    shm, a ShmQueue with CLONEMAP_IPC_SHM_SIZE bytes is used instead of a multiprocessing.Queue
+    with maxsize elements
+    """
+    if os.environ.get('CLONEMAP_IPC_'+channel, "queue") == "shm":
+        try:
+            return shmqueue.ShmQueue(ShmSize, ctx)
+        except RuntimeError as err:
+            logging.error("Agency: Cannot create shared memory queue: "+str(err))
+    return ctx.Queue(maxsize)
+
+
+def close_ipc_queue(q):
+    """
+    releases the shared memory of a ShmQueue
+    """
+    if isinstance(q, shmqueue.ShmQueue):
+        q.close()
+
+
+class RemoteAgency:
+    """
+    queue for messages to a remote agency which are sent by remote_agency_sender in a seperate
+    thread
+
+    put does not block; if PeerQueueSize messages are queued, the new (drop-newest) or the oldest
+    (drop-oldest) message is dropped according to CLONEMAP_PEER_OVERFLOW and counted in dropped
+    """
+    def __init__(self, address: str, failed: Callable[[str, list], None],
+                 maxsize: int = PeerQueueSize):
+        super().__init__()
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        y = threading.Thread(target=remote_agency_sender, args=(address, self._queue, failed,),
+                             daemon=True)
+        y.start()
+
+    def put(self, msg: datamodels.ACLMessage):
+        try:
+            self._queue.put(msg, block=False)
+            return
+        except queue.Full:
+            pass
+        if PeerOverflow == "drop-oldest":
+            try:
+                self._queue.get(block=False)
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put(msg, block=False)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+
+def remote_agency_sender(address: str, out: queue.Queue, failed: Callable[[str, list], None]):
+    """
+    sender to remote agency; executed in seperate thread; failed is called with all messages that
+    could not be sent
+
+    All messages that are queued for the remote agency are collected and sent within one request.
+    The size of one batch is limited by CLONEMAP_MSG_BATCH_SIZE (number of messages). After the
+    first message of a batch has been received, the sender waits at most CLONEMAP_MSG_BATCH_DELAY
+    milliseconds for further messages.
     """
     while True:
-        msg = out.get()
-        msg.agencyr = address
-        msg_dict = json.loads(msg.json())
+        msgs = collect_batch(out, MsgBatchSize, MsgBatchDelay)
+        if not post_msgs(address, msgs):
+            failed(address, msgs)
+
+
+def post_undeliverable(address: str, msg: datamodels.ACLMessage):
+    """
+    return undeliverable message to the sending agency
+    """
+    url = "http://"+address+":10000/api/agency/msgundeliv"
+    try:
+        resp = httpclient.post(url, data=msg.json())
+    except requests.exceptions.RequestException as err:
+        logging.error("Agency: Error for POST "+url+": "+str(err))
+        return
+    if resp.status_code != 201:
+        logging.error("Agency: Error for POST "+url+" Code: "+str(resp.status_code))
+
+
+def collect_batch(q: queue.Queue, size: int, delay: float) -> list:
+    """
+    waits for one element in the queue and collects further elements until size elements have
+    been collected or no further element arrived within delay seconds after the first one
+    """
+    batch = [q.get()]
+    deadline = time.monotonic() + delay
+    while len(batch) < size:
+        timeout = deadline - time.monotonic()
+        try:
+            if timeout <= 0:
+                batch.append(q.get(block=False))
+            else:
+                batch.append(q.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+
+# media types and content encodings advertised by remote agencies in their last response
+_accepted = {}
+# remote agencies which rejected the binary message encoding although they advertised it
+_json_agencies = set()
+
+
+def _parse_accept(value: str) -> tuple:
+    """
+    returns the media types or content encodings listed in an Accept-Post or Accept-Encoding header
+    """
+    return tuple(i.split(";")[0].strip() for i in value.split(",") if i.strip() != "")
+
+
+def post_msgs(address: str, msgs: list) -> bool:
+    """
+    post list of messages to remote agency; the binary encoding (CLONEMAP_MSG_ENCODING) and
+    compression (CLONEMAP_HTTP_COMPRESSION) are only used once the remote agency advertised them in
+    the Accept-Post and Accept-Encoding headers of a previous response, so that agencies without
+    support (e.g. older versions) receive uncompressed JSON; a rejection of the binary encoding
+    (status 415) is answered by sending JSON
+    """
+    for i in msgs:
+        i.agencyr = address
+    types, encodings = _accepted.get(address, ((), ()))
+    binary = (MsgEncoding == "binary" and wire.ContentType in types and
+              address not in _json_agencies)
+    headers = {}
+    if binary:
+        js = wire.encode_msgs(msgs)
+        headers['Content-Type'] = wire.ContentType
+    else:
         msg_dicts = []
-        msg_dicts.append(msg_dict)
+        for i in msgs:
+            msg_dicts.append(json.loads(i.json()))
         js = json.dumps(msg_dicts)
-        resp = requests.post("http://"+address+":10000/api/agency/msgs", data=js)
-        if resp.status_code != 201:
-            pass
+    url = "http://"+address+":10000/api/agency/msgs"
+    try:
+        resp = httpclient.post(url, data=js, headers=headers,
+                               compress=httpclient.Compression in encodings)
+    except requests.exceptions.RequestException as err:
+        logging.error("Agency: Error for POST "+url+": "+str(err))
+        # the remote agency might have been replaced by one without support
+        _accepted.pop(address, None)
+        return False
+    _accepted[address] = (_parse_accept(resp.headers.get('Accept-Post', "")),
+                          _parse_accept(resp.headers.get('Accept-Encoding', "")))
+    if binary and resp.status_code == 415:
+        # remote agency does not support binary encoding -> fall back to JSON
+        logging.info("Agency: Agency "+address+" does not accept binary messages")
+        _json_agencies.add(address)
+        return post_msgs(address, msgs)
+    if resp.status_code != 201:
+        logging.error("Agency: Error for POST "+url+" Code: "+str(resp.status_code))
+        return False
+    return True
+
+
+class AsyncRuntime:
+    """
+    asyncio event loop executed in a seperate thread which handles the outgoing traffic to remote
+    agencies
+
+    The http requests themselves are blocking and are executed in a pool of CLONEMAP_ASYNC_WORKERS
+    threads. Hence, the number of threads does not depend on the number of remote agencies. The
+    number of concurrent requests to one remote agency is limited by CLONEMAP_ASYNC_PEER_REQUESTS.
+    Other blocking functions (e.g. address resolution) are executed in a second pool of the same
+    size such that they cannot be starved by slow remote agencies.
+    """
+    def __init__(self):
+        super().__init__()
+        workers = int(os.environ.get('CLONEMAP_ASYNC_WORKERS', 8))
+        self.peer_requests = int(os.environ.get('CLONEMAP_ASYNC_PEER_REQUESTS', 1))
+        self.senders = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=workers))
+        x = threading.Thread(target=self._run, daemon=True)
+        x.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, func, *args) -> concurrent.futures.Future:
+        """
+        executes the blocking function func in the thread pool of the runtime; may be called from
+        any thread
+        """
+        return asyncio.run_coroutine_threadsafe(self._execute(func, *args), self.loop)
+
+    async def _execute(self, func, *args):
+        return await self.loop.run_in_executor(None, func, *args)
+
+    def new_sender(self, address: str, failed: Callable[[str, list], None]):
+        """
+        creates a sender for messages to a remote agency; failed is called with all messages that
+        could not be sent
+        """
+        return AsyncRemoteAgency(self, address, failed)
+
+
+class AsyncRemoteAgency:
+    """
+    sender to remote agency executed in the asyncio runtime
+
+    put may be called from any thread and does not block; if PeerQueueSize messages are queued,
+    the new (drop-newest) or the oldest (drop-oldest) message is dropped according to
+    CLONEMAP_PEER_OVERFLOW and counted in dropped
+    """
+    def __init__(self, runtime: AsyncRuntime, address: str,
+                 failed: Callable[[str, list], None], maxsize: int = PeerQueueSize):
+        super().__init__()
+        self.dropped = 0
+        self._runtime = runtime
+        self._address = address
+        self._failed = failed
+        self._slots = threading.BoundedSemaphore(maxsize)
+        runtime.loop.call_soon_threadsafe(self._start)
+
+    def _start(self):
+        self._queue = asyncio.Queue()
+        self._requests = asyncio.Semaphore(self._runtime.peer_requests)
+        self._runtime.loop.create_task(self._send())
+
+    def put(self, msg: datamodels.ACLMessage):
+        if self._slots.acquire(blocking=False):
+            self._runtime.loop.call_soon_threadsafe(self._enqueue, msg)
+        elif PeerOverflow == "drop-oldest":
+            self._runtime.loop.call_soon_threadsafe(self._replace_oldest, msg)
+        else:
+            self.dropped += 1
+
+    def _enqueue(self, msg: datamodels.ACLMessage):
+        self._queue.put_nowait(msg)
+
+    def _replace_oldest(self, msg: datamodels.ACLMessage):
+        # the new message takes over the slot of the oldest one; if all queued messages are
+        # being collected for a batch, the new message is dropped instead
+        if not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.put_nowait(msg)
+        self.dropped += 1
+
+    async def _send(self):
+        loop = self._runtime.loop
+        while True:
+            msgs = [await self._queue.get()]
+            deadline = loop.time() + MsgBatchDelay
+            while len(msgs) < MsgBatchSize:
+                timeout = deadline - loop.time()
+                if not self._queue.empty():
+                    msgs.append(self._queue.get_nowait())
+                elif timeout <= 0:
+                    break
+                else:
+                    try:
+                        msgs.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            for i in range(len(msgs)):
+                self._slots.release()
+            await self._requests.acquire()
+            fut = loop.run_in_executor(self._runtime.senders, self._post, msgs)
+            fut.add_done_callback(lambda f: self._requests.release())
+
+    def _post(self, msgs: list):
+        if not post_msgs(self._address, msgs):
+            self._failed(self._address, msgs)
 
 
 def agent_starter(agent_class: agent.Agent, info: datamodels.AgentInfo,
                   mas_name: str, mas_custom: str,
                   msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
-                  log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue):
+                  log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+                  ready: multiprocessing.Queue, local_agents: dict = None, log_flags=None,
+                  counters=None, slot: int = -1):
     """
-    starting agent; this function is to be called in a separate process
+    starting agent; this function is to be called in a separate process; the agent id is put into
+    ready before the agent task is executed
     """
+    # make child process handle signals with default handler
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
     ag = agent_class(info, mas_name, mas_custom, msg_in, msg_out, log_out, ts_out)
+    ag.acl._set_local_agents(local_agents, info.address.agency)
+    ag.logger._set_log_flags(log_flags)
+    ag.logger._set_counters(counters, slot)
+    ready.put(info.id)
     ag.task()
+
+
+def idle_agent_starter(agent_class: agent.Agent, mas_name: str, mas_custom: str,
+                       msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
+                       log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+                       ready: multiprocessing.Queue, start: multiprocessing.Queue,
+                       local_agents: dict, log_flags, counters, slot: int):
+    """
+    idle agent process of the warm pool; waits for the info of the agent to be executed in start;
+    this function is to be called in a separate process
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    info, known = start.get()
+    # agents which have been removed since the process was started are not known anymore
+    local = {}
+    for i in known:
+        if i in local_agents:
+            local[i] = local_agents[i]
+    agent_starter(agent_class, info, mas_name, mas_custom, msg_in, msg_out, log_out, ts_out, ready,
+                  local, log_flags, counters, slot)
+
+
+def worker_starter(agent_class: agent.Agent, mas_name: str, mas_custom: str, index: int,
+                   msg_ins: list, ctrl: multiprocessing.Queue, msg_out: multiprocessing.Queue,
+                   log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+                   ready: multiprocessing.Queue, log_flags, counters):
+    """
+    executes agents within a worker; this function is to be called in a separate process
+
+    Each agent is executed in its own thread. Incoming messages of all agents of the worker are
+    received in msg_ins[index] and distributed to the agents. Agents in the same worker exchange
+    messages without serialization; the receiver gets a shallow copy of the message.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    lock = threading.Lock()
+    inboxes = {}
+    # stop events and agents executed by the worker
+    stops = {}
+    agents = {}
+    # messages to agents assigned to the worker, but not started yet
+    pending = {}
+    stopped = set()
+
+    def distribute():
+        while True:
+            msg = msg_ins[index].get()
+            lock.acquire()
+            inbox = inboxes.get(msg.receiver, None)
+            if inbox is None and msg.receiver not in stopped:
+                pending.setdefault(msg.receiver, []).append(msg)
+            lock.release()
+            if inbox is not None:
+                inbox.put(msg)
+
+    def run_agent(info: datamodels.AgentInfo, inbox: queue.Queue, local: dict, slot: int,
+                  stop: threading.Event):
+        ag = agent_class(info, mas_name, mas_custom, inbox, msg_out, log_out, ts_out)
+        ag.logger._set_log_flags(log_flags)
+        ag.logger._set_counters(counters, slot)
+        directory = {}
+        lock.acquire()
+        for i in local:
+            worker, other_slot = local[i]
+            if worker == index and i in inboxes:
+                directory[i] = (inboxes[i], other_slot, False)
+            else:
+                directory[i] = (msg_ins[worker], other_slot, True)
+        if not stop.is_set():
+            agents[info.id] = ag
+        lock.release()
+        ag.acl._set_local_agents(directory, info.address.agency)
+        if stop.is_set():
+            # agent has been deleted before it was started
+            ag._stop()
+        else:
+            ready.put(info.id)
+            try:
+                ag.task()
+            except Exception as err:
+                logging.error("Agency: Task of agent " + str(info.id) + " failed: " + str(err))
+            # behaviors keep the agent alive after the task has returned
+            stop.wait()
+        ag.acl._thread.join()
+        # the slot of the agent may be reused now
+        ready.put(("stopped", slot))
+
+    x = threading.Thread(target=distribute, daemon=True)
+    x.start()
+    while True:
+        cmd = ctrl.get()
+        if cmd[0] == "start":
+            info = cmd[1]
+            inbox = queue.Queue()
+            stop = threading.Event()
+            lock.acquire()
+            inboxes[info.id] = inbox
+            stops[info.id] = stop
+            stopped.discard(info.id)
+            msgs = pending.pop(info.id, [])
+            for i in msgs:
+                inbox.put(i)
+            lock.release()
+            x = threading.Thread(target=run_agent, args=(info, inbox, cmd[2], cmd[3], stop,),
+                                 daemon=True)
+            x.start()
+        elif cmd[0] == "stop":
+            # the agent does not receive messages anymore and ends its threads; a task which
+            # neither returns from loop_forever or receive calls nor checks is_running keeps its
+            # slot reserved
+            lock.acquire()
+            inboxes.pop(cmd[1], None)
+            pending.pop(cmd[1], None)
+            stopped.add(cmd[1])
+            stop = stops.pop(cmd[1], None)
+            ag = agents.pop(cmd[1], None)
+            if stop is not None:
+                stop.set()
+            lock.release()
+            if ag is not None:
+                ag._stop()
@@ -51,11 +51,16 @@ import paho.mqtt.client as mqtt
 import multiprocessing
 import queue
 import threading
+import concurrent.futures
+import itertools
 import clonemapy.datamodels as datamodels
 import clonemapy.df as df
+import clonemapy.logger as logger
+import clonemapy.mailbox as mailbox
 from typing import Callable, Dict
 import time
 import logging
+import random
 # from collections.abc import Callable
 
 
@@ -143,11 +148,36 @@ class Agent():
         self.df = DF(info.masid, info.id, info.spec.nodeid)
         self.mqtt = MQTT(self.logger)
         self._lock = threading.Lock()
+        self._stop_event = threading.Event()
         # self.task()
 
     def loop_forever(self):
-        while True:
-            time.sleep(100)
+        """
+        blocks until the agent is stopped
+        """
+        self._stop_event.wait()
+
+    def is_running(self) -> bool:
+        """
+        returns False once the agent has been stopped; tasks that do not block in loop_forever or
+        in receiving messages should check it regularly and return when it is False
+        """
+        return not self._stop_event.is_set()
+
+    def _stop(self):
+        """
+        stops the agent in a worker: loop_forever returns, blocking receive calls return None and
+        behaviors end; logs and counters of the agent are discarded from now on
+        """
+        self._stop_event.set()
+        self.logger._stop()
+        self.acl._stop()
+        self.mqtt._stop()
+        self._lock.acquire()
+        q = self._customQueue
+        self._lock.release()
+        if q is not None:
+            _put_sentinel(q)
 
     def task(self):
         """
@@ -212,6 +242,116 @@ class Agent():
         self._lock.release()
 
 
+# index of the log topics in the shared log flags
+LogTopics = {"msg": 0, "app": 1, "status": 2, "debug": 3, "error": 4}
+# index of the limits for msg logs (rate, burst size and sampled fraction) in the shared log flags
+MsgLogRate = len(LogTopics)
+MsgLogBurst = MsgLogRate + 1
+MsgLogSample = MsgLogRate + 2
+NumLogFlags = MsgLogRate + 3
+
+
+def set_log_flags(flags, log_config: datamodels.LoggerConfig):
+    """
+    writes the topics enabled in log_config and the limits for msg logs to the shared log flags;
+    errors are always logged; limits not given in log_config are taken from CLONEMAP_MSG_LOG_RATE,
+    CLONEMAP_MSG_LOG_BURST and CLONEMAP_MSG_LOG_SAMPLE
+    """
+    flags[LogTopics["msg"]] = bool(log_config.msg)
+    flags[LogTopics["app"]] = bool(log_config.app)
+    flags[LogTopics["status"]] = bool(log_config.status)
+    flags[LogTopics["debug"]] = bool(log_config.debug)
+    flags[LogTopics["error"]] = True
+    rate = log_config.msgrate
+    if rate is None:
+        rate = float(os.environ.get('CLONEMAP_MSG_LOG_RATE', 0))
+    burst = log_config.msgburst
+    if burst is None:
+        burst = float(os.environ.get('CLONEMAP_MSG_LOG_BURST', 0))
+    sample = log_config.msgsample
+    if sample is None:
+        sample = float(os.environ.get('CLONEMAP_MSG_LOG_SAMPLE', 1))
+    flags[MsgLogRate] = rate
+    # the burst size defaults to the logs of one second
+    flags[MsgLogBurst] = burst if burst > 0 else max(rate, 1)
+    flags[MsgLogSample] = sample
+
+
+# overflow counters of each agent in the shared counter array of the agency
+Counters = {"log_dropped": 0, "log_delayed": 1, "ts_dropped": 2, "ts_delayed": 3,
+            "msg_dropped": 4, "msg_delayed": 5, "msg_log_suppressed": 6}
+# policies applied if the queue for logs, timeseries data or incoming messages is full (block,
+# drop-newest, drop-oldest or sample); drop-oldest acts like drop-newest on queues shared by
+# several agents
+LogOverflow = os.environ.get('CLONEMAP_LOG_OVERFLOW', "block")
+TsOverflow = os.environ.get('CLONEMAP_TS_OVERFLOW', "block")
+MsgOverflow = os.environ.get('CLONEMAP_MSG_OVERFLOW', "block")
+SampleRate = int(os.environ.get('CLONEMAP_OVERFLOW_SAMPLE_RATE', 10))
+# limits of the mailbox of incoming ACL messages (number of messages and total content length;
+# CLONEMAP_MSG_OVERFLOW is applied if exceeded) and age in seconds after which messages are evicted
+# and counted as dropped; 0 disables a limit
+MailboxSize = int(os.environ.get('CLONEMAP_MAILBOX_SIZE', 1000))
+MailboxBytes = int(os.environ.get('CLONEMAP_MAILBOX_BYTES', 0))
+MailboxMaxAge = float(os.environ.get('CLONEMAP_MAILBOX_MAX_AGE', 0))
+# number of overflows of each queue (by id) for sampling
+_overflows = {}
+
+
+def enqueue(q, item, policy: str, counters=None, index: int = -1, shared: bool = False,
+            timeout: float = None) -> bool:
+    """
+    puts item into q; if q is full, item is handled according to policy: block waits for free
+    space, drop-newest discards item, drop-oldest discards the first element of q and sample waits
+    for free space for every SampleRate-th overflow of q and discards all other items; if q is
+    shared by several agents, drop-oldest discards item as the first element of q might belong to
+    another agent; dropped and delayed items are counted in counters[index] and counters[index+1]
+    (unless index is negative); returns False if item was discarded; raises queue.Full if waiting
+    for free space takes longer than timeout seconds (None waits forever)
+    """
+    try:
+        q.put(item, block=False)
+        return True
+    except queue.Full:
+        pass
+    drop = policy == "drop-newest" or (policy == "drop-oldest" and shared)
+    if policy == "sample":
+        num = _overflows.get(id(q), 0) + 1
+        _overflows[id(q)] = num
+        drop = num % SampleRate != 0
+    elif policy == "drop-oldest" and not shared:
+        for i in range(3):
+            try:
+                q.get(block=False)
+                if index >= 0:
+                    counters[index] += 1
+            except queue.Empty:
+                pass
+            try:
+                q.put(item, block=False)
+                return True
+            except queue.Full:
+                pass
+        drop = True
+    if drop:
+        if index >= 0:
+            counters[index] += 1
+        return False
+    if index >= 0:
+        counters[index+1] += 1
+    q.put(item, timeout=timeout)
+    return True
+
+
+def _put_sentinel(q: queue.Queue):
+    """
+    puts None into q to end the thread reading from it; the sentinel is discarded if q is full
+    """
+    try:
+        q.put(None, block=False)
+    except queue.Full:
+        pass
+
+
 class Logger():
     """
     provides functions for logging
@@ -224,6 +364,16 @@ class Logger():
             ID of MAS agent is located in
     log_out : multiprocessing.Queue
               queue for log messages of agent
+    ts_out : multiprocessing.Queue
+             queue for timeseries samples of agent as tuples (agentid, name, timestamp, value)
+    log_flags : multiprocessing.RawArray
+                flags of the enabled log topics and limits for msg logs shared with and updated by
+                the agency; all topics are enabled if None
+    buckets : dict
+              token bucket (tokens, time of last update) for msg logs per message type
+    counters : multiprocessing.RawArray
+               overflow counters shared with the agency; the counters of the agent start at
+               index slot*len(Counters)
     """
     def __init__(self, masid: int, agentid: int, log_out, ts_out):
         super().__init__()
@@ -231,25 +381,153 @@ class Logger():
         self._masid = masid
         self._log_out = log_out
         self._ts_out = ts_out
+        self._log_flags = None
+        self._counters = None
+        self._index = -1
+        self._state = None
+        self._buckets = {}
+        self._stopped = False
+
+    def _set_log_flags(self, log_flags):
+        self._log_flags = log_flags
+
+    def _set_counters(self, counters, slot: int):
+        self._counters = counters
+        if counters is not None and slot >= 0:
+            self._index = slot*len(Counters)
+
+    def _stop(self):
+        # threads of a stopped agent must not write to the counters of a new agent in the slot
+        self._stopped = True
+        self._index = -1
+
+    def _counter_index(self, name: str) -> int:
+        """
+        returns the index of the counter name of the agent or -1 if the agent has no counters
+        """
+        if self._index < 0:
+            return -1
+        return self._index + Counters[name]
+
+    def _count(self, name: str, num: int):
+        index = self._counter_index(name)
+        if index >= 0:
+            self._counters[index] += num
 
     def new_log(self, topic: str, msg: str, data: str):
         """
-        stores one log messages
+        stores one log messages; logs of disabled topics are discarded
         """
-        if (topic != "msg" and topic != "error" and topic != "debug" and topic != "app" and
-                topic != "status"):
+        i = LogTopics.get(topic, None)
+        if i is None or self._stopped:
+            return
+        if self._log_flags is not None and not self._log_flags[i]:
+            return
+        if i == 0 and not self._admit_msg_log(msg):
             return
         log = datamodels.LogMessage(masid=self._masid, agentid=self._id, topic=topic, msg=msg,
                                     data=data)
-        self._log_out.put(log)
+        self._put_log(log)
+
+    def new_log_deferred(self, topic: str, msg: str, formatter: Callable, *args):
+        """
+        stores one log message whose data is rendered by formatter(*args) in the agency when the
+        log is sent; formatter has to be picklable (e.g. a module level function); args have to be
+        immutable values (e.g. the fields of a message instead of the message) such that later
+        changes by the caller do not alter the log; nothing is rendered if the topic is disabled
+        """
+        i = LogTopics.get(topic, None)
+        if i is None or self._stopped:
+            return
+        if self._log_flags is not None and not self._log_flags[i]:
+            return
+        if i == 0 and not self._admit_msg_log(msg):
+            return
+        log = datamodels.DeferredLog(self._masid, self._id, topic, msg, formatter, args)
+        self._put_log(log)
+
+    def _admit_msg_log(self, kind: str) -> bool:
+        """
+        applies sampling and the token bucket of the message type (e.g. ACL send) to a msg log;
+        suppressed logs are counted in the shared counters and reported by the agency
+        """
+        flags = self._log_flags
+        if flags is None:
+            return True
+        admit = True
+        if flags[MsgLogSample] < 1 and random.random() >= flags[MsgLogSample]:
+            admit = False
+        rate = flags[MsgLogRate]
+        if admit and rate > 0:
+            now = time.monotonic()
+            bucket = self._buckets.get(kind, None)
+            if bucket is None:
+                bucket = [flags[MsgLogBurst], now]
+                self._buckets[kind] = bucket
+            tokens = min(flags[MsgLogBurst], bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                admit = False
+                bucket[0] = tokens
+            else:
+                bucket[0] = tokens - 1
+        if not admit and self._index >= 0:
+            self._counters[self._index + Counters["msg_log_suppressed"]] += 1
+        return admit
+
+    def _put_log(self, log):
+        index = -1
+        if self._index >= 0:
+            index = self._index + Counters["log_dropped"]
+        enqueue(self._log_out, log, LogOverflow, self._counters, index, True)
+
+    def update_state(self, state: str):
+        """
+        updates the state of the agent; the agency only sends the latest state of each agent to the
+        logger in regular intervals; states share the log queue, but are not dropped according to
+        CLONEMAP_LOG_OVERFLOW as an older state must not be published instead of the latest one
+        """
+        self._state = state
+        if self._stopped:
+            return
+        st = datamodels.State(masid=self._masid, agentid=self._id, timestamp=datetime.now(),
+                              state=state)
+        index = -1
+        if self._index >= 0:
+            index = self._index + Counters["log_dropped"]
+        enqueue(self._log_out, st, "block", self._counters, index, True)
+
+    def get_state(self) -> str:
+        """
+        returns the state of the agent; the state is requested from the logger only if it has not
+        been updated or requested by the agent before
+        """
+        if self._state is None:
+            st = logger.get_state(self._masid, self._id)
+            if st is not None:
+                self._state = st.state
+        return self._state
+
+    def enabled(self, topic: str) -> bool:
+        """
+        returns True if logs of the topic are stored
+        """
+        i = LogTopics.get(topic, None)
+        if i is None:
+            return False
+        return self._log_flags is None or bool(self._log_flags[i])
 
     def new_timeseries_data(self, ts_name: str, value: float):
         """
         stores one timeseries sample
         """
-        ts = datamodels.TimeSeriesData(masid=self._masid, agentid=self._id, name=ts_name,
-                                       value=value)
-        self._ts_out.put(ts)
+        if self._stopped:
+            return
+        index = -1
+        if self._index >= 0:
+            index = self._index + Counters["ts_dropped"]
+        enqueue(self._ts_out, (self._id, ts_name, time.time(), float(value)), TsOverflow,
+                self._counters, index, True)
 
 
 class ACL():
@@ -264,31 +542,63 @@ class ACL():
              queue for incoming messages of agent
     _msg_out : multiprocessing.Queue
               queue of outgoing messages of agent
+    _msg_in_default : mailbox.Mailbox
+        mailbox for incoming messages of protocols without behavior
     _msg_in_protocol : dict
         dict mapping protocols to incoming queues which are checked by behaviors
+    _local_agents : dict
+        dict mapping the IDs of agents in the same agency to their incoming queue, their slot in
+        the overflow counters (-1 if none) and whether the queue is shared by several agents;
+        messages to these agents are not routed via the agency
+    _requests : dict
+        dict mapping receiver and repwith of pending requests to the generated convid (receiver
+        and convid, None if the convid was given) and the future that is completed with the reply
+    _conversations : dict
+        dict mapping receiver and generated convid of pending requests to receiver and repwith
     """
     def __init__(self, agent_id: int, msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
                  custom_callback: Callable[[str], None], log: Logger):
         super().__init__()
         self._id = agent_id
         self._msg_in = msg_in
-        self._msg_in_default = queue.Queue(1000)
+        self._msg_in_default = mailbox.Mailbox(MailboxSize, MailboxBytes, MailboxMaxAge,
+                                               self._count_evicted)
         self._msg_out = msg_out
         self._msg_in_protocol = {}
+        self._local_agents = {}
+        self._agency = ""
         self._custom_callback = custom_callback
         self._logger = log
         self._lock = threading.Lock()
-        x = threading.Thread(target=self._handle_messages, daemon=True)
-        x.start()
+        self._requests = {}
+        self._conversations = {}
+        self._request_ids = itertools.count()
+        self._thread = threading.Thread(target=self._handle_messages, daemon=True)
+        self._thread.start()
 
     def recv_message_wait(self) -> datamodels.ACLMessage:
         """
-        reads one message from incoming message queue; blocks if empty
+        reads one message from incoming message queue; blocks if empty; returns None if the agent
+        has been stopped
         """
-        msg = self._msg_in_default.get()
+        try:
+            msg = self._msg_in_default.get()
+        except queue.Empty:
+            return None
 
         return msg
 
+    def recv_message_filter(self, filter: dict,
+                            timeout: float = None) -> datamodels.ACLMessage:
+        """
+        reads the oldest message from incoming message queue whose attributes equal all values in
+        filter (keys sender, perf, prot and convid, e.g. {"sender": 17, "perf": 6}); other messages
+        remain in the queue; returns None if no message matches within timeout seconds (None waits
+        forever)
+        """
+        msg = self._msg_in_default.recv(filter, timeout)
+        return msg
+
     def recv_messages(self) -> list:
         """
         reads all messages from incoming message queue, if any
@@ -307,13 +617,165 @@ class ACL():
         sends message to receiver
         """
         msg.sender = self._id
-        self._msg_out.put(msg)
+        self._lock.acquire()
+        local = self._local_agents.get(msg.receiver, None)
+        self._lock.release()
+        handled = False
+        if local is not None:
+            # receiver is located in the same agency -> put message in its queue directly
+            msg.agencys = self._agency
+            msg.agencyr = self._agency
+            handled = self._put_local(msg, local)
+        if not handled:
+            self._msg_out.put(msg)
+        self._log_msg("ACL send", msg)
+
+    def _put_local(self, msg: datamodels.ACLMessage, local: tuple) -> bool:
+        """
+        puts msg into the incoming queue of a local agent according to CLONEMAP_MSG_OVERFLOW and
+        counts dropped and delayed messages for the receiver; a message waiting for free space is
+        not handed to the agency, as later messages could overtake it on the direct path; returns
+        False if the receiver has been removed while waiting; agents executed in the same process
+        receive a copy such that sender and receiver do not share the message object
+        """
+        q, slot, shared = local
+        if isinstance(q, queue.Queue):
+            msg = msg.copy()
+        counters = self._logger._counters
+        index = -1
+        if slot >= 0 and counters is not None:
+            index = slot*len(Counters) + Counters["msg_dropped"]
+        try:
+            enqueue(q, msg, MsgOverflow, counters, index, shared, 1)
+            return True
+        except queue.Full:
+            pass
+        while True:
+            self._lock.acquire()
+            local = self._local_agents.get(msg.receiver, None)
+            self._lock.release()
+            if local is None:
+                # the agency handles the message if the receiver has been removed meanwhile
+                return False
+            try:
+                local[0].put(msg, timeout=1)
+                return True
+            except queue.Full:
+                pass
+
+    def request(self, msg: datamodels.ACLMessage, timeout: float = None) -> datamodels.ACLMessage:
+        """
+        sends msg and waits for the reply; returns None if no reply arrives within timeout seconds
+        (None waits forever); late replies are received like any other message
+        """
+        fut = self.request_async(msg)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            if fut.cancel():
+                return None
+            # reply arrived in the meantime
+            return fut.result()
+
+    def request_async(self, msg: datamodels.ACLMessage) -> concurrent.futures.Future:
+        """
+        sends msg and returns a future that is completed with the reply; msg gets the repwith
+        "<id>-req-<n>" if it has none and a new negative convid if it has none (negative convids
+        are reserved for requests); a reply is the first message from the receiver with inrepto
+        set to the repwith or with the generated convid; replies are not put into the incoming
+        queues and done callbacks of the future run in the message handling thread; raises
+        ValueError if a request with the same repwith to the same receiver is pending
+        """
+        n = next(self._request_ids)
+        if msg.repwith is None:
+            msg.repwith = str(self._id) + "-req-" + str(n)
+        key = (msg.receiver, msg.repwith)
+        conv = None
+        if msg.convid is None:
+            msg.convid = -n - 1
+            conv = (msg.receiver, msg.convid)
+        fut = concurrent.futures.Future()
+        self._lock.acquire()
+        if key in self._requests:
+            self._lock.release()
+            raise ValueError("Request with repwith " + msg.repwith + " to agent " +
+                             str(msg.receiver) + " is pending")
+        self._requests[key] = (conv, fut)
+        if conv is not None:
+            self._conversations[conv] = key
+        self._lock.release()
+        fut.add_done_callback(lambda f: self._drop_request(key))
+        self.send_message(msg)
+        return fut
+
+    def _drop_request(self, key: tuple):
+        self._lock.acquire()
+        req = self._requests.pop(key, None)
+        if req is not None and req[0] is not None:
+            self._conversations.pop(req[0], None)
+        self._lock.release()
+
+    def _match_request(self, msg: datamodels.ACLMessage) -> concurrent.futures.Future:
+        """
+        returns the future of the pending request msg replies to, if any; convids are only matched
+        if they have been generated by request_async; to be called with locked lock
+        """
+        key = None
+        if msg.inrepto is not None and (msg.sender, msg.inrepto) in self._requests:
+            key = (msg.sender, msg.inrepto)
+        elif msg.convid is not None and msg.convid < 0:
+            key = self._conversations.get((msg.sender, msg.convid), None)
+        if key is None:
+            return None
+        conv, fut = self._requests.pop(key)
+        if conv is not None:
+            del self._conversations[conv]
+        return fut
+
+    def _count_evicted(self, num: int):
+        self._logger._count("msg_dropped", num)
+
+    def _set_local_agents(self, local_agents: dict, agency: str):
+        self._lock.acquire()
+        if local_agents is not None:
+            self._local_agents = dict(local_agents)
+            self._local_agents.pop(self._id, None)
+        if agency is not None:
+            self._agency = agency
+        self._lock.release()
+
+    def _stop(self):
+        """
+        ends the message handling thread, wakes up receiving calls and behaviors and cancels
+        pending requests
+        """
+        self._msg_in.put(None)
+        self._msg_in_default.close()
+        self._lock.acquire()
+        queues = list(self._msg_in_protocol.values())
+        futs = [i[1] for i in self._requests.values()]
+        self._lock.release()
+        for q in queues:
+            _put_sentinel(q)
+        for fut in futs:
+            fut.cancel()
 
     def _handle_messages(self):
         while True:
             msg = self._msg_in.get()
+            if msg is None:
+                # agent has been stopped
+                return
             self._route_message(msg)
-            self._logger.new_log("msg", "ACL receive", str(msg))
+            self._log_msg("ACL receive", msg)
+
+    def _log_msg(self, kind: str, msg: datamodels.ACLMessage):
+        """
+        stores a msg log of the message; the fields are passed instead of the message, as copying
+        and pickling them is cheaper and the message may be changed after it has been sent
+        """
+        self._logger.new_log_deferred("msg", kind, datamodels.format_acl_msg, msg.sender,
+                                      msg.receiver, msg.ts, msg.prot, msg.perf, msg.content)
 
     def _route_message(self, msg: datamodels.ACLMessage):
         """
@@ -322,12 +784,25 @@ class ACL():
         """
         if msg.prot == -1 and msg.sender == -1:
             self._custom_callback(msg.content)
+        elif msg.prot == -2 and msg.sender == -1:
+            # agent in same agency has been removed
+            self._lock.acquire()
+            self._local_agents.pop(int(msg.content), None)
+            self._lock.release()
         else:
             self._lock.acquire()
+            fut = None
+            if len(self._requests) > 0:
+                fut = self._match_request(msg)
             q = self._msg_in_protocol.get(msg.prot, None)
             self._lock.release()
-            if q is None:
-                self._msg_in_default.put(msg)
+            # a reply to a request cancelled concurrently (e.g. after a timeout) is received like
+            # any other message
+            if fut is not None and fut.set_running_or_notify_cancel():
+                fut.set_result(msg)
+            elif q is None:
+                enqueue(self._msg_in_default, msg, MsgOverflow, self._logger._counters,
+                        self._logger._counter_index("msg_dropped"))
             else:
                 q.put(msg)
 
@@ -353,6 +828,13 @@ class ACL():
         self._lock.release()
 
 
+def format_mqtt_msg(topic: str, payload) -> str:
+    """
+    returns the string representation of a mqtt message used for logging
+    """
+    return "Topic: "+str(topic)+";Content: "+str(payload)
+
+
 class MQTT():
     """
     provides functions for MQTT
@@ -392,7 +874,7 @@ class MQTT():
         if not self._on:
             return
         self._client.publish(topic, payload, qos, retain)
-        self._logger.new_log("msg", "MQTT publish", "Topic: "+str(topic)+";Content: "+str(payload))
+        self._logger.new_log_deferred("msg", "MQTT publish", format_mqtt_msg, topic, payload)
 
     def recv_msg(self) -> mqtt.MQTTMessage:
         """
@@ -428,8 +910,8 @@ class MQTT():
         """
         add received mqtt message to message queue
         """
-        self._logger.new_log("msg", "MQTT receive",
-                             "Topic: "+msg.topic+";Content: "+str(msg.payload))
+        self._logger.new_log_deferred("msg", "MQTT receive", format_mqtt_msg, msg.topic,
+                                      msg.payload)
         self._route_message(msg)
 
     def _connect(self):
@@ -476,6 +958,20 @@ class MQTT():
         beh = MQTTBehavior(self, "#", handle)
         return beh
 
+    def _stop(self):
+        """
+        disconnects from the broker and ends the behaviors
+        """
+        if not self._on:
+            return
+        self._disconnect()
+        self._lock.acquire()
+        queues = list(self._msg_in_topic.values())
+        self._lock.release()
+        queues.append(self._msg_in_default)
+        for q in queues:
+            _put_sentinel(q)
+
     def _register_behavior(self, topic: str) -> queue.Queue:
         if topic == "#":
             q = self._msg_in_default
@@ -617,6 +1113,8 @@ class ACLBehavior(Behavior):
         """
         while True:
             msg = self._queue.get()
+            if msg is None:
+                return
             self._handleDefault(msg)
 
 
@@ -650,6 +1148,8 @@ class MQTTBehavior(Behavior):
         """
         while True:
             msg = self._queue.get()
+            if msg is None:
+                return
             self._handle(msg)
 
 
@@ -708,4 +1208,6 @@ class CustomUpdateBehavior(Behavior):
         """
         while True:
             custom = self._queue.get()
+            if custom is None:
+                return
             self._handle(custom)
@@ -43,15 +43,16 @@
 """
 This module implements necessary client methods for the cloneMAP AMS
 """
-import requests
 import logging
 import json
+import concurrent.futures
 from typing import List
 import clonemapy.datamodels as datamodels
+import clonemapy.httpclient as httpclient
 
 
 def alive(host: str) -> bool:
-    resp = requests.get("http://"+host+"/api/alive")
+    resp = httpclient.get("http://"+host+"/api/alive")
     if resp.status_code == 200:
         return True
     return False
@@ -59,7 +60,7 @@ def alive(host: str) -> bool:
 
 def get_clonemap(host: str) -> datamodels.CloneMAP:
     url = "http://"+host+"/api/clonemap"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.CloneMAP.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -68,7 +69,7 @@ def get_clonemap(host: str) -> datamodels.CloneMAP:
 
 def get_mass(host: str) -> List[datamodels.MASInfoShort]:
     url = "http://"+host+"/api/clonemap/mas"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         mass = []
         mas_dicts = json.loads(resp.text)
@@ -83,7 +84,7 @@ def get_mass(host: str) -> List[datamodels.MASInfoShort]:
 
 def get_mass_by_name(host: str, mas_name: str) -> List[int]:
     url = "http://"+host+"/api/clonemap/mas/name/"+mas_name
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         mass = json.loads(resp.text)
         return mass
@@ -97,7 +98,7 @@ def post_mas(host: str, mas: datamodels.MASSpec):
     """
     js = mas.json()
     url = "http://"+host+"/api/clonemap/mas"
-    resp = requests.post(url, data=js)
+    resp = httpclient.post(url, data=js)
     if resp.status_code != 201:
         logging.error("AMS error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
@@ -108,7 +109,7 @@ def get_mas(host: str, masid: int) -> datamodels.MASInfo:
     get info of mas
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.MASInfo.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -117,7 +118,7 @@ def get_mas(host: str, masid: int) -> datamodels.MASInfo:
 
 def delete_mas(host: str, masid: int):
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)
-    resp = requests.delete(url)
+    resp = httpclient.delete(url)
     if resp.status_code != 200:
         logging.error("AMS error for DELETE "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
@@ -125,7 +126,7 @@ def delete_mas(host: str, masid: int):
 
 def delete_all_mass(host: str):
     url = "http://"+host+"/api/clonemap/mas"
-    resp = requests.delete(url)
+    resp = httpclient.delete(url)
     if resp.status_code != 200:
         logging.error("AMS error for DELETE "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
@@ -136,7 +137,7 @@ def get_agents(host: str, masid: int) -> datamodels.Agents:
     get agents in mas
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.Agents.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -148,7 +149,7 @@ def get_agents_by_name(host: str, masid: int, agent_name) -> List[int]:
     get agents in mas by name
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents/name/"+agent_name
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         agents = json.loads(resp.text)
         return agents
@@ -156,9 +157,32 @@ def get_agents_by_name(host: str, masid: int, agent_name) -> List[int]:
     return None
 
 
-def post_agents(host: str, masid: int, im_specs: List[datamodels.ImageGroupSpec]):
+def post_agents(host: str, masid: int, im_specs: List[datamodels.ImageGroupSpec],
+                chunk_size: int = 0, parallel: int = 1) -> bool:
     """
-    post agents
+    post agents; if chunk_size > 0 the agents of each image group are split into chunks of at most
+    chunk_size agents which are posted by up to parallel concurrent requests; returns True if all
+    requests succeeded
+    """
+    if chunk_size <= 0:
+        chunks = [im_specs]
+    else:
+        chunks = []
+        for i in im_specs:
+            for j in range(0, len(i.agents), chunk_size):
+                chunk = datamodels.ImageGroupSpec(config=i.config,
+                                                  agents=i.agents[j:j+chunk_size])
+                chunks.append([chunk])
+    if parallel <= 1 or len(chunks) <= 1:
+        return all([post_agent_chunk(host, masid, i) for i in chunks])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(lambda chunk: post_agent_chunk(host, masid, chunk), chunks))
+    return all(results)
+
+
+def post_agent_chunk(host: str, masid: int, im_specs: List[datamodels.ImageGroupSpec]) -> bool:
+    """
+    post one chunk of agents
     """
     im_dicts = []
     for i in im_specs:
@@ -166,10 +190,12 @@ def post_agents(host: str, masid: int, im_specs: List[datamodels.ImageGroupSpec]
         im_dicts.append(im_dict)
     js = json.dumps(im_dicts)
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents"
-    resp = requests.post(url, data=js)
+    resp = httpclient.post(url, data=js, compress=True)
     if resp.status_code != 201:
         logging.error("AMS error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
+        return False
+    return True
 
 
 def get_agent(host: str, masid: int, agentid: int) -> datamodels.AgentInfo:
@@ -177,7 +203,7 @@ def get_agent(host: str, masid: int, agentid: int) -> datamodels.AgentInfo:
     get agents in mas
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents/"+str(agentid)
-    resp = requests.get()
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.AgentInfo.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -189,7 +215,7 @@ def get_agent_address(host: str, masid: int, agentid: int) -> datamodels.Address
     get address of agent
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents/"+str(agentid) + "/address"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.Address.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -198,7 +224,7 @@ def get_agent_address(host: str, masid: int, agentid: int) -> datamodels.Address
 
 def delete_agent(host: str, masid: int, agentid: int):
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents/"+str(agentid)
-    resp = requests.delete(url)
+    resp = httpclient.delete(url)
     if resp.status_code != 200:
         logging.error("AMS error for DELETE "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
@@ -206,7 +232,7 @@ def delete_agent(host: str, masid: int, agentid: int):
 
 def put_agent_custom(host: str, masid: int, agentid: int, custom: str):
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agents/"+str(agentid) + "/custom"
-    resp = requests.put(url, data=custom)
+    resp = httpclient.put(url, data=custom)
     if resp.status_code != 200:
         logging.error("AMS error for PUT "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
 
@@ -216,7 +242,7 @@ def get_agencies(host: str, masid: int) -> datamodels.Agencies:
     get agencies in mas
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/agencies"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.Agencies.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -230,7 +256,7 @@ def get_agency_info_full(host: str, masid: int, imid: int,
     """
     url = "http://"+host+"/api/clonemap/mas/"+str(masid)+"/imgroup/"+str(imid) + "/agency/"
     url += str(agencyid)
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.AgencyInfoFull.parse_raw(resp.text)
     logging.error("AMS error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
@@ -246,6 +272,20 @@ def new_agent(host: str, image: str, secret: str, masid: int, name: str, custom:
     post_agents(host, masid, im_group_specs)
 
 
+def new_agents(host: str, image: str, secret: str, masid: int, names: List[str],
+               customs: List[str], chunk_size: int = 100, parallel: int = 4) -> bool:
+    """
+    creates several agents with the same image; the agents are submitted in chunks of chunk_size
+    agents by up to parallel concurrent requests
+    """
+    im_group_config = datamodels.ImageGroupConfig(image=image, secret=secret)
+    agent_specs = []
+    for i, name in enumerate(names):
+        agent_specs.append(datamodels.AgentSpec(nodeid=0, name=name, custom=customs[i]))
+    im_group_spec = datamodels.ImageGroupSpec(config=im_group_config, agents=agent_specs)
+    return post_agents(host, masid, [im_group_spec], chunk_size, parallel)
+
+
 def update_or_create_agent(host: str, image: str, secret: str, masid: int, name: str, custom: str):
     agents = get_agents_by_name(host, masid, name)
     if agents is None:
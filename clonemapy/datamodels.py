@@ -7,6 +7,7 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 
 from datetime import datetime
+import time
 
 from enum import Enum
 
@@ -29,6 +30,11 @@ class LoggerConfig(BaseModel):
     app: Optional[bool] = Field(None, description='activation of app log topic')
     status: Optional[bool] = Field(None, description='activation of status log topic')
     debug: Optional[bool] = Field(None, description='activation of debug log topic')
+    msgrate: Optional[float] = Field(
+        None, description='maximum rate of msg logs per agent and message type in 1/s (0: no limit)'
+    )
+    msgburst: Optional[float] = Field(None, description='burst size of msg logs')
+    msgsample: Optional[float] = Field(None, description='fraction of msg logs which are kept')
 
 
 class DFConfig(BaseModel):
@@ -251,6 +257,29 @@ class FipaProtocol(Enum):
     Propose = 11
 
 
+# names of performatives and protocols used for string representation of messages
+_PerformativeNames = {i.value: i.name for i in FipaPerformative}
+_ProtocolNames = {i.value: i.name for i in FipaProtocol}
+
+
+def format_acl_msg(sender: int, receiver: int, ts: datetime, prot: int, perf: int,
+                   content: str) -> str:
+    """
+    returns the string representation of an ACL message used for logging
+    """
+    ret = "Sender: " + str(sender) + ";Receiver: " + str(receiver) + ";Timestamp: "
+    ret += str(ts) + ";Protocol: "
+    name = _ProtocolNames.get(prot, None)
+    if name is None:
+        name = "Unknown(" + str(prot) + ")"
+    ret += name + ";Performative: "
+    name = _PerformativeNames.get(perf, None)
+    if name is None:
+        name = "Unknown(" + str(perf) + ")"
+    ret += name + ";Content: " + content
+    return ret
+
+
 class ACLMessage(BaseModel):
     ts: datetime = Field(default_factory=datetime.now, description='sending time')
     perf: int = Field(
@@ -317,19 +346,13 @@ class ACLMessage(BaseModel):
         }
 
     def __str__(self):
-        ret = "Sender: " + str(self.sender) + ";Receiver: " + str(self.receiver) + ";Timestamp: "
-        ret += str(self.ts) + ";Protocol: "
-        try:
-            ret += FipaProtocol(self.prot).name
-        except ValueError:
-            ret += "Unknown(" + str(self.prot) + ")"
-        ret += ";Performative: "
-        try:
-            ret += FipaPerformative(self.perf).name
-        except ValueError:
-            ret += "Unknown(" + str(self.perf) + ")"
-        ret += ";Content: " + self.content
-        return ret
+        return format_acl_msg(self.sender, self.receiver, self.ts, self.prot, self.perf,
+                              self.content)
+
+    def __reduce__(self):
+        # pickle with the compact binary encoding
+        import clonemapy.wire as wire
+        return (wire.decode_msg, (wire.encode_msg(self),))
 
 
 class LogMessage(BaseModel):
@@ -347,6 +370,38 @@ class LogMessage(BaseModel):
         }
 
 
+class DeferredLog():
+    """
+    log message whose data is rendered by calling formatter(*args) when the log is sent, i.e. not
+    within the agent; formatter has to be picklable (e.g. a module level function)
+    """
+    __slots__ = ("masid", "agentid", "topic", "msg", "formatter", "args", "timestamp")
+
+    def __init__(self, masid: int, agentid: int, topic: str, msg: str, formatter, args: tuple,
+                 timestamp: float = None):
+        self.masid = masid
+        self.agentid = agentid
+        self.topic = topic
+        self.msg = msg
+        self.formatter = formatter
+        self.args = args
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamp = timestamp
+
+    def __reduce__(self):
+        return (DeferredLog, (self.masid, self.agentid, self.topic, self.msg, self.formatter,
+                              self.args, self.timestamp))
+
+    def render(self) -> LogMessage:
+        """
+        returns the log message with rendered data
+        """
+        return LogMessage(masid=self.masid, agentid=self.agentid, topic=self.topic,
+                          timestamp=datetime.fromtimestamp(self.timestamp), msg=self.msg,
+                          data=self.formatter(*self.args))
+
+
 class TimeSeriesData(BaseModel):
     masid: int = Field(..., description='ID of MAS')
     agentid: int = Field(..., description='ID of Agent')
@@ -43,16 +43,16 @@
 """
 This module implements necessary client methods for the cloneMAP DF
 """
-import requests
 import json
 import logging
 import clonemapy.datamodels as datamodels
+import clonemapy.httpclient as httpclient
 
 Host = "http://df:12000"
 
 
 def alive() -> bool:
-    resp = requests.get(Host+"/api/alive")
+    resp = httpclient.get(Host+"/api/alive")
     if resp.status_code == 200:
         return True
     return False
@@ -64,7 +64,7 @@ def post_svc(masid: int, svc: datamodels.Service) -> datamodels.Service:
     """
     js = svc.json()
     url = Host+"/api/df/"+str(masid)+"/svc"
-    resp = requests.post(url, data=js)
+    resp = httpclient.post(url, data=js)
     if resp.status_code == 201:
         svc = datamodels.Service.parse_raw(resp.text)
     else:
@@ -78,7 +78,7 @@ def get_svc(masid: int, desc: str) -> list:
     """
     svcs = []
     url = Host+"/api/df/"+str(masid)+"/svc/desc/"+desc
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         svc_dicts = json.loads(resp.text)
         if svc_dicts is None:
@@ -98,7 +98,7 @@ def get_local_svc(masid: int, desc: str, nodeid: int, dist: float) -> list:
     """
     svcs = []
     url = Host+"/api/df/"+str(masid)+"/svc/desc/"+desc+"/node/"+str(nodeid)+"/dist/" + str(dist)
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         svc_dicts = json.loads(resp.text)
         if svc_dicts is None:
@@ -117,7 +117,7 @@ def delete_svc(masid: int, svcid: int):
     delete service with svcid
     """
     url = Host+"/api/df/"+str(masid)+"/svc/id/"+svcid
-    resp = requests.delete(url)
+    resp = httpclient.delete(url)
     if resp.status_code != 200:
         logging.error("DF error for DELETE "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
@@ -129,14 +129,14 @@ def post_graph(masid: int, gr: datamodels.Graph):
     """
     js = gr.json()
     url = Host+"/api/df/"+str(masid)+"/graph"
-    resp = requests.post(url, data=js)
+    resp = httpclient.post(url, data=js)
     if resp.status_code != 201:
         logging.error("DF error for POST "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
 
 
 def get_graph(masid: int) -> datamodels.Graph:
     url = Host+"/api/df/"+str(masid)+"/graph"
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.Graph.parse_raw(resp.text)
     logging.error("DF error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
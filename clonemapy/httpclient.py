@@ -0,0 +1,286 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a pool of keep-alive http sessions which is shared by the clients of the
+cloneMAP components (AMS, DF, logger) and by the agency for messaging with remote agencies.
+
+One session is kept per target host so that connections to this host are reused. The number of
+connections kept per host is limited by CLONEMAP_HTTP_POOL_SIZE. If CLONEMAP_HTTP_POOL_BLOCK is
+set to ON, requests wait for a free connection instead of opening additional ones.
+
+Bodies of bulk POST requests can be compressed with gzip or deflate (CLONEMAP_HTTP_COMPRESSION)
+if they are larger than CLONEMAP_HTTP_COMPRESS_MIN bytes. Hosts which reject compressed bodies
+(status 415) receive uncompressed bodies afterwards. A comparison of the compression
+settings is run by python -m clonemapy.httpclient.
+"""
+import gzip
+import os
+import threading
+import time
+import zlib
+import requests
+from urllib.parse import urlsplit
+
+PoolSize = int(os.environ.get('CLONEMAP_HTTP_POOL_SIZE', 10))
+PoolBlock = os.environ.get('CLONEMAP_HTTP_POOL_BLOCK', "OFF") == "ON"
+Compression = os.environ.get('CLONEMAP_HTTP_COMPRESSION', "off")
+CompressMin = int(os.environ.get('CLONEMAP_HTTP_COMPRESS_MIN', 1024))
+CompressLevel = int(os.environ.get('CLONEMAP_HTTP_COMPRESS_LEVEL', 1))
+# content encodings supported by decompress_body
+Encodings = ("gzip", "deflate")
+
+_lock = threading.Lock()
+_sessions = {}
+_requests = {}
+_compressed = {}
+_uncompressed = set()
+_pid = os.getpid()
+
+
+def _reset():
+    """
+    discards the state inherited from the parent process after a fork; sessions must not be
+    shared with the parent and the lock might have been held by another thread of the parent
+    """
+    global _lock, _pid
+    _lock = threading.Lock()
+    _sessions.clear()
+    _requests.clear()
+    _compressed.clear()
+    _uncompressed.clear()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def session(url: str) -> requests.Session:
+    """
+    returns the session for the host of url; a new session is created if none exists
+    """
+    host = urlsplit(url).netloc
+    if _pid != os.getpid():
+        # forked without os.register_at_fork (python < 3.7)
+        _reset()
+    with _lock:
+        sess = _sessions.get(host, None)
+        if sess is None:
+            sess = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=PoolSize,
+                                                    pool_block=PoolBlock)
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            _sessions[host] = sess
+            _requests[host] = 0
+        _requests[host] += 1
+    return sess
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return session(url).get(url, **kwargs)
+
+
+def post(url: str, data=None, compress: bool = False, **kwargs) -> requests.Response:
+    """
+    post request; if compress is True, the body is compressed according to
+    CLONEMAP_HTTP_COMPRESSION
+    """
+    if not compress or Compression == "off" or data is None or len(data) < CompressMin:
+        return session(url).post(url, data=data, **kwargs)
+    host = urlsplit(url).netloc
+    if host in _uncompressed:
+        return session(url).post(url, data=data, **kwargs)
+    body = compress_body(data, Compression, CompressLevel)
+    headers = dict(kwargs.pop('headers', None) or {})
+    plain_headers = dict(headers)
+    headers['Content-Encoding'] = Compression
+    resp = session(url).post(url, data=body, headers=headers, **kwargs)
+    if resp.status_code == 415:
+        # host does not accept compressed bodies; other errors are returned to the caller
+        with _lock:
+            _uncompressed.add(host)
+        return session(url).post(url, data=data, headers=plain_headers, **kwargs)
+    with _lock:
+        stat = _compressed.setdefault(host, [0, 0, 0])
+        stat[0] += 1
+        stat[1] += len(data)
+        stat[2] += len(body)
+    return resp
+
+
+def compress_body(data, encoding: str, level: int) -> bytes:
+    """
+    compresses data (str or bytes) with gzip or deflate
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if encoding == "gzip":
+        return gzip.compress(data, level)
+    if encoding == "deflate":
+        return zlib.compress(data, level)
+    raise ValueError("unknown content encoding " + encoding)
+
+
+def decompress_body(data: bytes, encoding: str) -> bytes:
+    """
+    decompresses a body with content encoding gzip, deflate or identity; raises ValueError if the
+    encoding is not supported or the body is invalid
+    """
+    if encoding is None or encoding == "" or encoding == "identity":
+        return data
+    if encoding not in Encodings:
+        raise ValueError("unknown content encoding " + encoding)
+    try:
+        if encoding == "gzip":
+            return gzip.decompress(data)
+        if encoding == "deflate":
+            return zlib.decompress(data)
+    except (OSError, EOFError, zlib.error) as err:
+        raise ValueError("invalid " + encoding + " body: " + str(err))
+
+
+def put(url: str, data=None, **kwargs) -> requests.Response:
+    return session(url).put(url, data=data, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return session(url).delete(url, **kwargs)
+
+
+def close():
+    """
+    closes all sessions and their connections
+    """
+    with _lock:
+        for host in _sessions:
+            _sessions[host].close()
+        _sessions.clear()
+        _requests.clear()
+        _compressed.clear()
+
+
+def stats() -> dict:
+    """
+    returns the number of requests and the number of opened connections for each host as well as
+    the number of compressed requests and their size before and after compression
+    """
+    ret = {}
+    with _lock:
+        for host in _sessions:
+            conns = 0
+            pools = _sessions[host].get_adapter("http://"+host).poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    conns += pool.num_connections
+            ret[host] = {'requests': _requests[host], 'connections': conns}
+            stat = _compressed.get(host, None)
+            if stat is not None:
+                ret[host]['compressed'] = stat[0]
+                ret[host]['raw_bytes'] = stat[1]
+                ret[host]['compressed_bytes'] = stat[2]
+    return ret
+
+
+def benchmark(num: int = 200, batch: int = 500) -> list:
+    """
+    posts num batches of batch log messages to a local stand-in receiver which decompresses the
+    bodies; returns a tuple (encoding, level, bytes sent, client cpu seconds, receiver cpu seconds,
+    wall seconds) for each setting
+    """
+    import http.server
+    import json
+    cpu = [0.0]
+
+    class Receiver(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length')))
+            start = time.thread_time()
+            json.loads(decompress_body(body, self.headers.get('Content-Encoding', None)))
+            cpu[0] += time.thread_time() - start
+            self.send_response(201)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    Receiver.protocol_version = "HTTP/1.1"
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    x = threading.Thread(target=server.serve_forever, daemon=True)
+    x.start()
+    url = "http://127.0.0.1:"+str(server.server_address[1])+"/api/logging/0/list"
+    logs = []
+    for i in range(batch):
+        logs.append({'masid': 0, 'agentid': i % 50, 'topic': "msg",
+                     'timestamp': "2021-01-01T00:00:00."+str(i).zfill(6)+"Z", 'msg': "ACL send",
+                     'data': "Sender: "+str(i % 50)+";Receiver: "+str(i % 7)+";Protocol: Request"
+                             ";Performative: Inform;Content: value="+str(i * 0.37)})
+    js = json.dumps(logs)
+    results = []
+    for encoding, level in (("off", 0), ("gzip", 1), ("gzip", 6), ("deflate", 1)):
+        cpu[0] = 0.0
+        sent = 0
+        wall = time.perf_counter()
+        client = time.process_time()
+        for i in range(num):
+            if encoding == "off":
+                body = js
+                headers = {}
+            else:
+                body = compress_body(js, encoding, level)
+                headers = {'Content-Encoding': encoding}
+            sent += len(body)
+            session(url).post(url, data=body, headers=headers)
+        # process time includes the receiver thread
+        client = time.process_time() - client - cpu[0]
+        results.append((encoding, level, sent, client, cpu[0], time.perf_counter() - wall))
+    server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    print("encoding level   MB sent  client cpu s  receiver cpu s  wall s")
+    for res in benchmark():
+        print("%-8s %5d %9.2f %13.3f %15.3f %7.3f" % (res[0], res[1], res[2] / 1e6, res[3],
+                                                      res[4], res[5]))
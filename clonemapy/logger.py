@@ -43,25 +43,34 @@
 """
 This module implements necessary client methods for the cloneMAP logger
 """
-import requests
+import fnmatch
 import json
 import logging
+from array import array
+from datetime import datetime
 import clonemapy.datamodels as datamodels
+import clonemapy.httpclient as httpclient
 import os
 import queue
-from typing import List
+import struct
+import threading
+import time
+import requests
+import clonemapy.spill as spill
+from typing import Callable, List
 
 Host = "http://logger:11000"
+Timeout = float(os.environ.get('CLONEMAP_LOGGER_TIMEOUT', 10))
 
 
 def alive() -> bool:
-    resp = requests.get(Host+"/api/alive")
+    resp = httpclient.get(Host+"/api/alive")
     if resp.status_code == 200:
         return True
     return False
 
 
-def post_logs(masid: int, logs: List[datamodels.LogMessage]):
+def post_logs(masid: int, logs: List[datamodels.LogMessage]) -> bool:
     """
     post array of log messages to logger
     """
@@ -70,17 +79,30 @@ def post_logs(masid: int, logs: List[datamodels.LogMessage]):
         log_dict = json.loads(i.json())
         log_dicts.append(log_dict)
     js = json.dumps(log_dicts)
+    return post_logs_json(masid, js)
+
+
+def post_logs_json(masid: int, js: str) -> bool:
+    """
+    post array of log messages which is already encoded as json to logger
+    """
     url = Host+"/api/logging/"+str(masid)+"/list"
-    resp = requests.post(url, data=js)
+    try:
+        resp = httpclient.post(url, data=js, compress=True, timeout=Timeout)
+    except requests.exceptions.RequestException as err:
+        logging.error("Logger error for POST "+url+": "+str(err))
+        return False
     if resp.status_code != 201:
         logging.error("Logger error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
+        return False
+    return True
 
 
 def get_latest_logs(masid: int, agentid: int, topic: str, num: int) -> List[datamodels.LogMessage]:
     logs = []
     url = Host+"/api/logging/"+str(masid)+"/"+str(agentid)+"/"+topic+"/latest/" + str(num)
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         log_dicts = json.loads(resp.text)
         if log_dicts is None:
@@ -94,7 +116,7 @@ def get_latest_logs(masid: int, agentid: int, topic: str, num: int) -> List[data
     return logs
 
 
-def post_timeseries_data(masid: int, ts: List[datamodels.TimeSeriesData]):
+def post_timeseries_data(masid: int, ts: List[datamodels.TimeSeriesData]) -> bool:
     """
     post array of time series data to logger
     """
@@ -103,11 +125,24 @@ def post_timeseries_data(masid: int, ts: List[datamodels.TimeSeriesData]):
         ts_dict = json.loads(i.json())
         ts_dicts.append(ts_dict)
     js = json.dumps(ts_dicts)
+    return post_timeseries_json(masid, js)
+
+
+def post_timeseries_json(masid: int, js: str) -> bool:
+    """
+    post array of time series data which is already encoded as json to logger
+    """
     url = Host+"/api/series/"+str(masid)
-    resp = requests.post(url, data=js)
+    try:
+        resp = httpclient.post(url, data=js, compress=True, timeout=Timeout)
+    except requests.exceptions.RequestException as err:
+        logging.error("Logger error for POST "+url+": "+str(err))
+        return False
     if resp.status_code != 201:
         logging.error("Logger error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
+        return False
+    return True
 
 
 def put_state(masid: int, agentid: int, state: datamodels.State):
@@ -116,23 +151,32 @@ def put_state(masid: int, agentid: int, state: datamodels.State):
     """
     js = state.json()
     url = Host+"/api/state/"+str(masid)+"/"+str(agentid)
-    resp = requests.post(url, data=js)
+    resp = httpclient.post(url, data=js)
     if resp.status_code != 201:
         logging.error("Logger error for PUT "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
 
 
-def update_states(masid: int, states: List[datamodels.State]):
+def update_states(masid: int, states: List[datamodels.State]) -> bool:
+    """
+    update states of several agents
+    """
     state_dicts = []
     for i in states:
         state_dict = json.loads(i.json())
         state_dicts.append(state_dict)
     js = json.dumps(state_dicts)
     url = Host+"/api/state/"+str(masid)+"/list"
-    resp = requests.post(url, data=js)
+    try:
+        resp = httpclient.post(url, data=js, compress=True, timeout=Timeout)
+    except requests.exceptions.RequestException as err:
+        logging.error("Logger error for POST "+url+": "+str(err))
+        return False
     if resp.status_code != 201:
         logging.error("Logger error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
                       resp.text)
+        return False
+    return True
 
 
 def get_state(masid: int, agentid: int) -> datamodels.State:
@@ -140,7 +184,7 @@ def get_state(masid: int, agentid: int) -> datamodels.State:
     request state of agent
     """
     url = Host+"/api/state/"+str(masid)+"/"+str(agentid)
-    resp = requests.get(url)
+    resp = httpclient.get(url)
     if resp.status_code == 200:
         return datamodels.State.parse_raw(resp.text)
     logging.error("Logger error for GET "+url+" Code: "+str(resp.status_code)+", Body: " +
@@ -148,32 +192,350 @@ def get_state(masid: int, agentid: int) -> datamodels.State:
     return None
 
 
-def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.Queue):
+# number of items in a spilled batch
+_Count = struct.Struct("I")
+
+
+def new_spill_buffer(name: str) -> spill.SpillBuffer:
     """
-    wait for logs in the queue and send them to logger (to be executed in seperate thread)
+    returns the spill buffer for the channel name (logs or series) within CLONEMAP_SPILL_DIR or
+    None if spilling is disabled; the size of the segment files, the quota per channel and the
+    drop policy are configured with CLONEMAP_SPILL_SEGMENT_SIZE, CLONEMAP_SPILL_QUOTA and
+    CLONEMAP_SPILL_POLICY (drop-oldest or drop-newest)
+    """
+    directory = os.environ.get('CLONEMAP_SPILL_DIR', "")
+    if directory == "":
+        return None
+    segment_size = int(os.environ.get('CLONEMAP_SPILL_SEGMENT_SIZE', 4 << 20))
+    quota = int(os.environ.get('CLONEMAP_SPILL_QUOTA', 256 << 20))
+    policy = os.environ.get('CLONEMAP_SPILL_POLICY', "drop-oldest")
+    return spill.SpillBuffer(os.path.join(directory, name), segment_size, quota, policy)
+
+
+class BatchSender:
+    """
+    sends json encoded batches in a separate thread such that reading the queues of the agents is
+    not delayed by slow requests; up to CLONEMAP_LOG_PENDING batches wait in memory; if a spill
+    buffer is given, batches which do not fit into memory or could not be sent are spilled to disk
+    and replayed once the logger accepts requests again; otherwise failed batches are retried every
+    CLONEMAP_LOG_RETRY_INTERVAL ms
+
+    Attributes
+    ----------
+    post : callable
+           sends one json encoded batch; returns True on success
+    spill : spill.SpillBuffer
+            disk buffer for batches; None if spilling is disabled
+    pending : queue.Queue
+              batches waiting to be sent
+    done : threading.Event
+           set when the sender stopped
     """
-    log_on = os.environ['CLONEMAP_LOGGING']
-    if log_on == "ON":
+    def __init__(self, post: Callable[[str], bool], spill_buffer: spill.SpillBuffer = None):
+        self.post = post
+        self.spill = spill_buffer
+        self.pending = queue.Queue(int(os.environ.get('CLONEMAP_LOG_PENDING', 4)))
+        self.retry = float(os.environ.get('CLONEMAP_LOG_RETRY_INTERVAL', 1000))/1000
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.bytes = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.post_time = 0.0
+
+    def send(self, js: str, num: int, first: float, block: bool = True) -> bool:
+        """
+        hands over a batch of num items whose first item was buffered at time first; returns
+        False if the batch was not accepted (only if block is False and spilling is disabled)
+        """
+        try:
+            self.pending.put((js, num, first), block=False)
+            return True
+        except queue.Full:
+            pass
+        if self.spill is not None:
+            self.spill_batch(js, num)
+            return True
+        if not block:
+            return False
+        self.pending.put((js, num, first))
+        return True
+
+    def spill_batch(self, js: str, num: int):
+        self.lock.acquire()
+        self.spill.append(_Count.pack(num) + js.encode())
+        self.lock.release()
+
+    def run(self):
+        """
+        sends the pending batches and replays spilled batches (to be executed in seperate thread);
+        putting None into pending stops the sender
+        """
+        healthy = True
         while True:
-            log = log_queue.get()
-            if ((log.topic == "msg" and not log_config.msg) or
-                    (log.topic == "app" and not log_config.app) or
-                    (log.topic == "debug" and not log_config.debug) or
-                    (log.topic == "status" and not log_config.status)):
+            timeout = None
+            if self.spilled() > 0:
+                # replay spilled batches when idle, wait before retrying after a failure
+                timeout = 0 if healthy else self.retry
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                healthy = self.replay()
                 continue
-            logs = []
-            logs.append(log)
-            post_logs(masid, logs)
-    else:
+            if item is None:
+                self.done.set()
+                return
+            healthy = self.deliver(item[0], item[1], item[2])
+
+    def deliver(self, js: str, num: int, first: float) -> bool:
+        """
+        sends one batch; the batch is spilled or retried if the request fails; returns False if
+        the request failed
+        """
+        while True:
+            if self.post_batch(js, num, first):
+                return True
+            if self.spill is not None:
+                self.spill_batch(js, num)
+                return False
+            if self.done.is_set():
+                return False
+            time.sleep(self.retry)
+
+    def replay(self) -> bool:
+        """
+        sends the oldest spilled batch; returns False if the request failed
+        """
+        self.lock.acquire()
+        data = self.spill.peek()
+        self.lock.release()
+        if data is None:
+            return True
+        num = _Count.unpack_from(data)[0]
+        if not self.post_batch(str(data[_Count.size:], 'utf-8'), num, time.monotonic()):
+            return False
+        self.lock.acquire()
+        self.spill.pop()
+        self.lock.release()
+        return True
+
+    def post_batch(self, js: str, num: int, first: float) -> bool:
+        start = time.monotonic()
+        ok = self.post(js)
+        end = time.monotonic()
+        self.lock.acquire()
+        if ok:
+            self.batches += 1
+            self.items += num
+            self.bytes += len(js)
+            self.max_batch = max(self.max_batch, num)
+            self.latency += end - first
+            self.max_latency = max(self.max_latency, end - first)
+        else:
+            self.failed += 1
+        self.post_time += end - start
+        self.lock.release()
+        return ok
+
+    def spilled(self) -> int:
+        if self.spill is None:
+            return 0
+        self.lock.acquire()
+        num = len(self.spill)
+        self.lock.release()
+        return num
+
+    def stop(self, timeout: float) -> bool:
+        """
+        sends or spills the pending batches and stops the sender; spilled batches remain on disk;
+        returns False if the sender did not stop within timeout seconds
+        """
+        try:
+            self.pending.put(None, timeout=timeout)
+        except queue.Full:
+            return False
+        ret = self.done.wait(timeout)
+        # stop retrying
+        self.done.set()
+        if ret and self.spill is not None:
+            self.lock.acquire()
+            self.spill.close()
+            self.lock.release()
+        return ret
+
+    def stats(self) -> dict:
+        """
+        returns the number of sent batches, items and bytes, the number of failed requests, the
+        average and maximum batch size and latency (time between buffering of the first item of a
+        batch and completion of the request), the average request duration and the statistics of
+        the spill buffer
+        """
+        self.lock.acquire()
+        batches = max(self.batches, 1)
+        ret = {'batches': self.batches, 'items': self.items, 'bytes': self.bytes,
+               'failed': self.failed,
+               'batch_size_avg': self.items / batches,
+               'batch_size_max': self.max_batch,
+               'latency_avg_ms': self.latency * 1000 / batches,
+               'latency_max_ms': self.max_latency * 1000,
+               'post_avg_ms': self.post_time * 1000 / max(self.batches + self.failed, 1),
+               'pending': self.pending.qsize()}
+        if self.spill is not None:
+            ret['spill'] = self.spill.stats()
+        self.lock.release()
+        return ret
+
+
+class LogShipper:
+    """
+    sends the logs of the log queue to the logger in batches; a batch is sent as soon as it
+    contains CLONEMAP_LOG_BATCH_SIZE logs or CLONEMAP_LOG_BATCH_BYTES bytes or its first log waited
+    for CLONEMAP_LOG_FLUSH_INTERVAL ms; batches are sent by a BatchSender which spills them to disk
+    if the logger is slow or unavailable; putting None into the log queue flushes the pending batch
+    and stops the shipper
+
+    Attributes
+    ----------
+    masid : int
+            id of the mas
+    log_config : datamodels.LoggerConfig
+                 enabled log topics
+    log_queue : queue.Queue
+                queue the agents put their logs and states into
+    states : StatePublisher
+             publisher the states of the agents are passed to; states are discarded if None
+    batch_size : int
+                 maximum number of logs per batch
+    batch_bytes : int
+                  maximum size of a batch in bytes
+    interval : float
+               maximum time in seconds a log is buffered before it is sent
+    sender : BatchSender
+             sends the batches to the logger
+    done : threading.Event
+           set when the shipper stopped
+    """
+    def __init__(self, masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.Queue,
+                 states=None):
+        self.masid = masid
+        self.log_config = log_config
+        self.log_queue = log_queue
+        self.states = states
+        self.batch_size = int(os.environ.get('CLONEMAP_LOG_BATCH_SIZE', 500))
+        self.batch_bytes = int(os.environ.get('CLONEMAP_LOG_BATCH_BYTES', 1 << 20))
+        self.interval = float(os.environ.get('CLONEMAP_LOG_FLUSH_INTERVAL', 500))/1000
+        self.sender = None
+        self.done = threading.Event()
+
+    def filtered(self, log: datamodels.LogMessage) -> bool:
+        """
+        returns True if the topic of the log is disabled
+        """
+        return ((log.topic == "msg" and not self.log_config.msg) or
+                (log.topic == "app" and not self.log_config.app) or
+                (log.topic == "debug" and not self.log_config.debug) or
+                (log.topic == "status" and not self.log_config.status))
+
+    def run(self):
+        """
+        wait for logs in the queue and send them to logger (to be executed in seperate thread)
+        """
+        if os.environ['CLONEMAP_LOGGING'] != "ON":
+            self.print_logs()
+            return
+        self.sender = BatchSender(lambda js: post_logs_json(self.masid, js),
+                                  new_spill_buffer("logs"))
+        x = threading.Thread(target=self.sender.run, daemon=True)
+        x.start()
+        batch = []
+        size = 0
+        first = 0.0
+        while True:
+            timeout = None
+            if len(batch) > 0:
+                timeout = max(first + self.interval - time.monotonic(), 0)
+            try:
+                log = self.log_queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush(batch, size, first)
+                batch = []
+                size = 0
+                continue
+            if log is None:
+                self.flush(batch, size, first)
+                self.done.set()
+                return
+            if isinstance(log, datamodels.State):
+                if self.states is not None:
+                    self.states.update(log)
+                continue
+            if self.filtered(log):
+                continue
+            if isinstance(log, datamodels.DeferredLog):
+                log = log.render()
+            js = log.json()
+            if len(batch) == 0:
+                first = time.monotonic()
+            batch.append(js)
+            size += len(js)
+            # the interval is checked here as well since the queue may not run empty
+            if (len(batch) >= self.batch_size or size >= self.batch_bytes or
+                    time.monotonic() - first >= self.interval):
+                self.flush(batch, size, first)
+                batch = []
+                size = 0
+
+    def flush(self, batch: List[str], size: int, first: float):
+        """
+        hands one batch of json encoded logs to the sender; first is the time the first log was
+        buffered
+        """
+        if len(batch) == 0:
+            return
+        self.sender.send("["+",".join(batch)+"]", len(batch), first)
+
+    def stop(self, timeout: float) -> bool:
+        """
+        flushes the pending logs and stops the shipper; returns False if the shipper did not stop
+        within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        self.log_queue.put(None)
+        if not self.done.wait(timeout):
+            return False
+        if self.sender is None:
+            return True
+        return self.sender.stop(max(deadline - time.monotonic(), 0))
+
+    def stats(self) -> dict:
+        """
+        returns the statistics of the sender
+        """
+        if self.sender is None:
+            return {}
+        return self.sender.stats()
+
+    def print_logs(self):
+        """
+        writes the logs to the python logger if logging to the logger module is disabled
+        """
         python_logger = logging.getLogger("agentlogs")
         python_logger.setLevel("DEBUG")
         while True:
-            log = log_queue.get()
-            if ((log.topic == "msg" and not log_config.msg) or
-                    (log.topic == "app" and not log_config.app) or
-                    (log.topic == "debug" and not log_config.debug) or
-                    (log.topic == "status" and not log_config.status)):
+            log = self.log_queue.get()
+            if log is None:
+                self.done.set()
+                return
+            if isinstance(log, datamodels.State):
+                continue
+            if self.filtered(log):
                 continue
+            if isinstance(log, datamodels.DeferredLog):
+                log = log.render()
             if log.topic == "error":
                 msg = "Agent"+str(log.agentid)+": " + str(log.msg)
                 if log.data != "":
@@ -191,17 +553,414 @@ def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.
                 python_logger.info(msg)
 
 
-def send_timeseries_data(masid: int, ts_queue: queue.Queue):
+class StatePublisher:
     """
-    wait for timeseries data in the queue and send them to logger (to be executed in seperate
-    thread)
+    keeps the latest state of each agent (latest wins) and sends all states updated since the last
+    flush with one request every CLONEMAP_STATE_FLUSH_INTERVAL ms; states of a failed request are
+    sent with the next flush unless they have been updated meanwhile
+
+    Attributes
+    ----------
+    masid : int
+            id of the mas
+    interval : float
+               time between two flushes in seconds
+    dirty : dict of datamodels.State
+            states updated since the last flush per agent
+    done : threading.Event
+           set when the publisher stopped
     """
-    log_on = os.environ['CLONEMAP_LOGGING']
-    while True:
-        ts = ts_queue.get()
-        if log_on == "ON":
-            tss = []
-            tss.append(ts)
-            post_logs(masid, tss)
+    def __init__(self, masid: int):
+        self.masid = masid
+        self.interval = float(os.environ.get('CLONEMAP_STATE_FLUSH_INTERVAL', 1000))/1000
+        self.dirty = {}
+        self.stopped = threading.Event()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.sent = 0
+        self.failed = 0
+
+    def update(self, state: datamodels.State):
+        """
+        stores the state of an agent; a previous state which has not been sent yet is replaced
+        """
+        self.lock.acquire()
+        if state.agentid in self.dirty:
+            self.coalesced += 1
+        self.dirty[state.agentid] = state
+        self.updates += 1
+        self.lock.release()
+
+    def run(self):
+        """
+        flushes the states periodically (to be executed in seperate thread)
+        """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+        self.done.set()
+
+    def flush(self):
+        """
+        sends all states updated since the last flush
+        """
+        self.lock.acquire()
+        states = self.dirty
+        self.dirty = {}
+        self.lock.release()
+        if len(states) == 0:
+            return
+        ok = update_states(self.masid, list(states.values()))
+        self.lock.acquire()
+        if ok:
+            self.flushes += 1
+            self.sent += len(states)
         else:
-            pass
+            self.failed += 1
+            for i in states:
+                if i not in self.dirty:
+                    self.dirty[i] = states[i]
+        self.lock.release()
+
+    def stop(self, timeout: float) -> bool:
+        """
+        sends the remaining states and stops the publisher; returns False if the publisher did not
+        stop within timeout seconds
+        """
+        self.stopped.set()
+        return self.done.wait(timeout)
+
+    def stats(self) -> dict:
+        """
+        returns the number of state updates, of updates replaced by a newer state before being
+        sent, of requests, of sent states and of failed requests
+        """
+        self.lock.acquire()
+        ret = {'updates': self.updates, 'coalesced': self.coalesced, 'flushes': self.flushes,
+               'sent': self.sent, 'failed': self.failed, 'dirty': len(self.dirty)}
+        self.lock.release()
+        return ret
+
+
+def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.Queue):
+    """
+    wait for logs in the queue and send them to logger in batches (to be executed in seperate
+    thread)
+    """
+    LogShipper(masid, log_config, log_queue).run()
+
+
+def parse_series_rules(value: str) -> list:
+    """
+    parses a list of series rules of the form pattern=setting;pattern=setting; returns a list of
+    tuples (pattern, setting)
+    """
+    rules = []
+    for i in value.split(";"):
+        if i.strip() == "":
+            continue
+        pattern, setting = i.split("=", 1)
+        rules.append((pattern.strip(), setting.strip()))
+    return rules
+
+
+class Aggregate:
+    """
+    aggregate of the samples of one series within one window
+
+    Attributes
+    ----------
+    start : float
+            start of the window in seconds since the epoch
+    """
+    Functions = ("min", "max", "mean", "last", "count")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.sum = 0.0
+        self.last = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sum += value
+        self.last = value
+
+    def value(self, func: str) -> float:
+        if func == "min":
+            return self.min
+        elif func == "max":
+            return self.max
+        elif func == "mean":
+            return self.sum / self.count
+        elif func == "last":
+            return self.last
+        return float(self.count)
+
+
+class TimeSeriesShipper:
+    """
+    buffers the time series samples of the ts queue per agent and series name in array-backed
+    columns and sends them to the logger in batches; the buffer is flushed every
+    CLONEMAP_TS_FLUSH_INTERVAL ms or as soon as it holds CLONEMAP_TS_BATCH_SIZE samples; batches
+    are sent by a BatchSender; samples which the sender does not accept stay in the buffer, samples
+    arriving while the buffer holds CLONEMAP_TS_MAX_SAMPLES samples are dropped; putting None into
+    the ts queue flushes the buffer and stops the shipper
+
+    Series can be aggregated in the agency such that only the aggregates are sent. The windows are
+    configured with CLONEMAP_TS_WINDOWS as list of rules pattern=window:functions separated by ";",
+    e.g. "grid.*=1000:mean,max;soc=500:last"; pattern is matched against the series name, window is
+    given in ms and functions is a comma separated list of min, max, mean, last and count. The
+    aggregates are sent with the start of the window as timestamp; if several functions are given,
+    the function name is appended to the series name (e.g. grid.p.mean). Series which are not
+    aggregated can be filtered with a deadband configured with CLONEMAP_TS_DEADBAND as list of
+    rules pattern=deadband; a sample is only sent if it differs by more than the deadband from the
+    last sent sample (deadband 0: send changes only). The first matching rule applies.
+
+    Attributes
+    ----------
+    masid : int
+            id of the mas
+    ts_queue : queue.Queue
+               queue the agents put their samples into as tuples (agentid, name, timestamp, value)
+    series : dict of tuple of array.array
+             timestamps and values of buffered samples per (agentid, name)
+    buffered : int
+               number of buffered samples
+    windows : dict of Aggregate
+              open aggregation window per (agentid, name)
+    sender : BatchSender
+             sends the batches to the logger
+    done : threading.Event
+           set when the shipper stopped
+    """
+    def __init__(self, masid: int, ts_queue: queue.Queue):
+        self.masid = masid
+        self.ts_queue = ts_queue
+        self.batch_size = int(os.environ.get('CLONEMAP_TS_BATCH_SIZE', 5000))
+        self.max_samples = int(os.environ.get('CLONEMAP_TS_MAX_SAMPLES', 100000))
+        self.interval = float(os.environ.get('CLONEMAP_TS_FLUSH_INTERVAL', 1000))/1000
+        self.series = {}
+        self.buffered = 0
+        self.failing = False
+        self.window_rules = []
+        for pattern, setting in parse_series_rules(os.environ.get('CLONEMAP_TS_WINDOWS', "")):
+            window, funcs = setting.split(":", 1)
+            funcs = [i.strip() for i in funcs.split(",") if i.strip() in Aggregate.Functions]
+            self.window_rules.append((pattern, float(window)/1000, funcs))
+        self.deadband_rules = []
+        for pattern, setting in parse_series_rules(os.environ.get('CLONEMAP_TS_DEADBAND', "")):
+            self.deadband_rules.append((pattern, float(setting)))
+        # window, functions and deadband per series name
+        self.rules = {}
+        self.windows = {}
+        self.last_sent = {}
+        self.sender = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.aggregated = 0
+        self.suppressed = 0
+
+    def rule(self, name: str) -> tuple:
+        """
+        returns window, aggregation functions and deadband of the series
+        """
+        ret = self.rules.get(name, None)
+        if ret is not None:
+            return ret
+        ret = (0, [], None)
+        for pattern, window, funcs in self.window_rules:
+            if fnmatch.fnmatchcase(name, pattern):
+                ret = (window, funcs, None)
+                break
+        if ret[0] == 0:
+            for pattern, deadband in self.deadband_rules:
+                if fnmatch.fnmatchcase(name, pattern):
+                    ret = (0, [], deadband)
+                    break
+        self.rules[name] = ret
+        return ret
+
+    def add(self, agentid: int, name: str, timestamp: float, value: float):
+        """
+        aggregates, filters or buffers one sample; timestamp is given in seconds since the epoch
+        """
+        window, funcs, deadband = self.rule(name)
+        key = (agentid, name)
+        if window > 0:
+            start = timestamp - timestamp % window
+            agg = self.windows.get(key, None)
+            if agg is not None and agg.start != start:
+                self.emit(key, agg, funcs)
+                agg = None
+            if agg is None:
+                agg = Aggregate(start)
+                self.windows[key] = agg
+            agg.add(value)
+            self.aggregated += 1
+            return
+        if deadband is not None:
+            last = self.last_sent.get(key, None)
+            if last is not None and abs(value - last) <= deadband:
+                self.suppressed += 1
+                return
+            self.last_sent[key] = value
+        self.buffer(agentid, name, timestamp, value)
+
+    def emit(self, key: tuple, agg: Aggregate, funcs: list):
+        """
+        buffers the aggregates of a closed window
+        """
+        for i in funcs:
+            name = key[1]
+            if len(funcs) > 1:
+                name += "." + i
+            self.buffer(key[0], name, agg.start, agg.value(i))
+
+    def close_windows(self, now: float = None):
+        """
+        emits the aggregates of all windows which ended one flush interval before now (or of all
+        windows if now is None)
+        """
+        for key in list(self.windows.keys()):
+            window, funcs, deadband = self.rule(key[1])
+            agg = self.windows[key]
+            if now is None or agg.start + window + self.interval <= now:
+                self.emit(key, agg, funcs)
+                del self.windows[key]
+
+    def buffer(self, agentid: int, name: str, timestamp: float, value: float):
+        """
+        buffers one sample to be sent
+        """
+        if self.buffered >= self.max_samples:
+            self.dropped += 1
+            return
+        col = self.series.get((agentid, name), None)
+        if col is None:
+            col = (array('d'), array('d'))
+            self.series[(agentid, name)] = col
+        col[0].append(timestamp)
+        col[1].append(value)
+        self.buffered += 1
+
+    def run(self):
+        """
+        wait for samples in the queue and send them to logger (to be executed in seperate thread)
+        """
+        if os.environ['CLONEMAP_LOGGING'] != "ON":
+            while self.ts_queue.get() is not None:
+                pass
+            self.done.set()
+            return
+        self.sender = BatchSender(lambda js: post_timeseries_json(self.masid, js),
+                                  new_spill_buffer("series"))
+        x = threading.Thread(target=self.sender.run, daemon=True)
+        x.start()
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                ts = self.ts_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self.close_windows(time.time())
+                self.flush()
+                deadline = time.monotonic() + self.interval
+                continue
+            if ts is None:
+                self.close_windows()
+                self.flush(block=True)
+                self.done.set()
+                return
+            if isinstance(ts, datamodels.TimeSeriesData):
+                self.add(ts.agentid, ts.name, ts.timestamp.timestamp(), ts.value)
+            else:
+                self.add(ts[0], ts[1], ts[2], ts[3])
+            if time.monotonic() >= deadline:
+                # the queue did not run empty within the flush interval
+                self.close_windows(time.time())
+                self.flush()
+                deadline = time.monotonic() + self.interval
+            elif self.buffered >= self.batch_size and not self.failing:
+                # if the sender did not accept a batch the buffer is only flushed by the timer
+                self.flush()
+                deadline = time.monotonic() + self.interval
+
+    def flush(self, block: bool = False):
+        """
+        hands the buffered samples to the sender in batches of about batch_size samples; samples of
+        a batch which is not accepted and all following ones remain buffered
+        """
+        batch = []
+        keys = []
+        for key in list(self.series.keys()):
+            stamps, values = self.series[key]
+            for j in range(len(stamps)):
+                batch.append({'masid': self.masid, 'agentid': key[0], 'name': key[1],
+                              'timestamp': datetime.fromtimestamp(stamps[j]).isoformat("T")+"Z",
+                              'value': values[j]})
+            keys.append(key)
+            if len(batch) >= self.batch_size:
+                if not self.post(batch, keys, block):
+                    return
+                batch = []
+                keys = []
+        if len(batch) > 0:
+            self.post(batch, keys, block)
+
+    def post(self, batch: list, keys: list, block: bool) -> bool:
+        """
+        hands one batch to the sender and removes the series in keys from the buffer if the batch
+        was accepted
+        """
+        ok = self.sender.send(json.dumps(batch), len(batch), time.monotonic(), block)
+        self.failing = not ok
+        if ok:
+            self.lock.acquire()
+            for i in keys:
+                del self.series[i]
+            self.buffered -= len(batch)
+            self.lock.release()
+        return ok
+
+    def stop(self, timeout: float) -> bool:
+        """
+        flushes the buffered samples and stops the shipper; returns False if the shipper did not
+        stop within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        self.ts_queue.put(None)
+        if not self.done.wait(timeout):
+            return False
+        if self.sender is None:
+            return True
+        return self.sender.stop(max(deadline - time.monotonic(), 0))
+
+    def stats(self) -> dict:
+        """
+        returns the number of dropped, aggregated and suppressed (deadband) samples, the number of
+        currently buffered samples and series and open windows and the statistics of the sender
+        """
+        self.lock.acquire()
+        ret = {'dropped': self.dropped, 'aggregated': self.aggregated,
+               'suppressed': self.suppressed, 'buffered': self.buffered,
+               'series': len(self.series), 'windows': len(self.windows)}
+        self.lock.release()
+        if self.sender is not None:
+            ret.update(self.sender.stats())
+        return ret
+
+
+def send_timeseries_data(masid: int, ts_queue: queue.Queue):
+    """
+    wait for timeseries data in the queue and send them to logger in batches (to be executed in
+    seperate thread)
+    """
+    TimeSeriesShipper(masid, ts_queue).run()
@@ -0,0 +1,268 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements the mailbox of incoming ACL messages of an agent.
+
+Messages are stored in arrival order and are indexed by sender, performative, protocol and
+conversation ID. Hence, the oldest message matching a filter (e.g. the next inform of agent 17)
+is found without scanning the messages in front of it.
+
+Like queue.Queue, the mailbox can be bounded by the number of messages and by the total size of
+their contents; put blocks or raises queue.Full if the mailbox is full, such that the overflow
+policy of the caller is applied. Optionally, messages older than a maximum age are evicted.
+"""
+import collections
+import queue
+import threading
+import time
+from typing import Callable
+
+# attributes of ACL messages that are indexed
+Fields = ("sender", "perf", "prot", "convid")
+
+
+class Mailbox():
+    """
+    mailbox of ACL messages with selective receive
+
+    Attributes
+    ----------
+    max_len : integer
+              maximum number of stored messages; 0 disables the limit
+    max_bytes : integer
+                maximum total length of the contents of stored messages; 0 disables the limit
+    max_age : float
+              time in seconds after which messages are evicted; 0 disables eviction
+    evicted : integer
+              number of messages evicted so far
+    on_evict : Callable[[int], None]
+               called with the number of evicted messages, if not None
+    _msgs : collections.OrderedDict
+            stored messages by sequence number in arrival order
+    _index : dict
+             dict for every indexed field mapping field values to ordered dicts of sequence
+             numbers
+    """
+    def __init__(self, max_len: int = 0, max_bytes: int = 0, max_age: float = 0,
+                 on_evict: Callable[[int], None] = None):
+        super().__init__()
+        self.max_len = max_len
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evicted = 0
+        self.on_evict = on_evict
+        self._msgs = collections.OrderedDict()
+        self._index = {}
+        for field in Fields:
+            self._index[field] = {}
+        self._seq = 0
+        self._bytes = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._msgs)
+
+    def close(self):
+        """
+        closes the mailbox; waiting calls return, messages put afterwards are discarded and recv
+        does not wait anymore
+        """
+        self._cond.acquire()
+        self._closed = True
+        self._cond.notify_all()
+        self._cond.release()
+
+    def put(self, msg, block: bool = True, timeout: float = None):
+        """
+        stores msg; if the mailbox is full, waits for free space (up to timeout seconds if block is
+        True) and raises queue.Full otherwise like queue.Queue.put
+        """
+        size = len(msg.content)
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        self._cond.acquire()
+        try:
+            now = time.monotonic()
+            self._evict(now)
+            while self._full(size) and not self._closed:
+                if not block:
+                    raise queue.Full
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        raise queue.Full
+                    self._cond.wait(wait)
+                now = time.monotonic()
+                self._evict(now)
+            if not self._closed:
+                self._insert(msg, size, now)
+        finally:
+            self._cond.release()
+
+    def _full(self, size: int) -> bool:
+        """
+        returns True if a message with content length size does not fit; an empty mailbox always
+        accepts a message
+        """
+        if len(self._msgs) == 0:
+            return False
+        if self.max_len > 0 and len(self._msgs) >= self.max_len:
+            return True
+        return self.max_bytes > 0 and self._bytes + size > self.max_bytes
+
+    def _insert(self, msg, size: int, now: float):
+        seq = self._seq
+        self._seq += 1
+        self._msgs[seq] = (msg, now, size)
+        self._bytes += size
+        for field in Fields:
+            seqs = self._index[field].get(getattr(msg, field), None)
+            if seqs is None:
+                seqs = collections.OrderedDict()
+                self._index[field][getattr(msg, field)] = seqs
+            seqs[seq] = None
+        self._cond.notify_all()
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        removes and returns the oldest message; raises queue.Empty if no message is available
+        (within timeout seconds if block is True) like queue.Queue.get or if the mailbox is closed
+        """
+        msg = self.recv(None, timeout if block else 0)
+        if msg is None:
+            raise queue.Empty
+        return msg
+
+    def recv(self, filter: dict = None, timeout: float = None):
+        """
+        removes and returns the oldest message whose attributes equal all values in filter (e.g.
+        {"sender": 17, "perf": 6}); the keys of filter have to be in Fields; waits up to timeout
+        seconds (None waits forever) and returns None if no message matches or the mailbox is closed
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        self._cond.acquire()
+        while True:
+            self._evict(time.monotonic())
+            seq = self._find(filter)
+            if seq is not None:
+                msg = self._remove(seq)
+                # wake up blocked put
+                self._cond.notify_all()
+                break
+            if self._closed:
+                msg = None
+                break
+            if deadline is None:
+                self._cond.wait()
+                continue
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                msg = None
+                break
+            self._cond.wait(wait)
+        self._cond.release()
+        return msg
+
+    def _find(self, filter: dict) -> int:
+        """
+        returns the sequence number of the oldest message matching filter or None; the smallest
+        index of the filter values is searched
+        """
+        if not filter:
+            return next(iter(self._msgs), None)
+        best = None
+        for field in filter:
+            seqs = self._index[field].get(filter[field], None)
+            if seqs is None:
+                return None
+            if best is None or len(seqs) < len(best):
+                best = seqs
+        for seq in best:
+            msg = self._msgs[seq][0]
+            match = True
+            for field in filter:
+                if getattr(msg, field) != filter[field]:
+                    match = False
+                    break
+            if match:
+                return seq
+        return None
+
+    def _remove(self, seq: int):
+        """
+        removes the message with sequence number seq from the mailbox and its indices
+        """
+        msg, _, size = self._msgs.pop(seq)
+        self._bytes -= size
+        for field in Fields:
+            index = self._index[field]
+            value = getattr(msg, field)
+            seqs = index[value]
+            del seqs[seq]
+            if len(seqs) == 0:
+                del index[value]
+        return msg
+
+    def _evict(self, now: float):
+        """
+        evicts messages older than max_age
+        """
+        if self.max_age <= 0:
+            return
+        count = 0
+        while len(self._msgs) > 0:
+            seq, entry = next(iter(self._msgs.items()))
+            if now - entry[1] < self.max_age:
+                break
+            self._remove(seq)
+            count += 1
+        if count > 0:
+            self.evicted += count
+            self._cond.notify_all()
+            if self.on_evict is not None:
+                self.on_evict(count)
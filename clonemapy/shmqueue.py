@@ -0,0 +1,246 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a queue for the communication among processes which is based on a ring
+buffer in shared memory. It can be used instead of multiprocessing.Queue for the message and log
+channels of agents.
+
+Each element is stored as length-prefixed frame in the ring buffer. Unlike multiprocessing.Queue,
+put writes the frame directly to the buffer without a feeder thread or pipe. Waiting consumers are
+woken up by a semaphore (futex-based on Linux). Several processes may put and get concurrently.
+Producers that find the buffer full poll for free space.
+
+The module requires multiprocessing.shared_memory (Python >= 3.8). A comparison with
+multiprocessing.Queue is run by python -m clonemapy.shmqueue.
+"""
+import pickle
+import queue
+import struct
+import time
+import multiprocessing
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+_Header = struct.Struct("QQ")
+_Offset = struct.Struct("Q")
+_Length = struct.Struct("I")
+
+
+class ShmQueue():
+    """
+    multi-producer multi-consumer queue based on a ring buffer in shared memory
+
+    Attributes
+    ----------
+    capacity : integer
+               size of ring buffer in bytes
+    """
+    def __init__(self, capacity: int = 1 << 20, ctx=multiprocessing, dumps=None, loads=None):
+        super().__init__()
+        if shared_memory is None:
+            raise RuntimeError("shared memory is not supported by this python version")
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=_Header.size + capacity)
+        _Header.pack_into(self._shm.buf, 0, 0, 0)
+        self._owner = True
+        self._put_lock = ctx.Lock()
+        self._get_lock = ctx.Lock()
+        self._items = ctx.Semaphore(0)
+        self._dumps = dumps
+        self._loads = loads
+
+    def __getstate__(self):
+        return (self._shm.name, self.capacity, self._put_lock, self._get_lock, self._items,
+                self._dumps, self._loads)
+
+    def __setstate__(self, state):
+        name, self.capacity, self._put_lock, self._get_lock, self._items, self._dumps, \
+            self._loads = state
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13 does not support track
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+
+    def put(self, obj, block: bool = True, timeout: float = None):
+        """
+        puts obj into the queue; if the buffer is full and block is True, put waits for free space
+        at most timeout seconds; raises queue.Full if no space is available
+        """
+        if self._dumps is None:
+            data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        else:
+            data = self._dumps(obj)
+        frame = _Length.pack(len(data)) + data
+        if len(frame) > self.capacity:
+            raise ValueError("object too large for queue")
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        delay = 0.00001
+        while True:
+            self._put_lock.acquire()
+            head, tail = _Header.unpack_from(self._shm.buf, 0)
+            if self.capacity - (tail - head) >= len(frame):
+                self._write(tail, frame)
+                # the head is changed by consumers concurrently; only the tail is written
+                _Offset.pack_into(self._shm.buf, 8, tail + len(frame))
+                self._put_lock.release()
+                self._items.release()
+                return
+            self._put_lock.release()
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                raise queue.Full
+            time.sleep(delay)
+            delay = min(delay * 2, 0.001)
+
+    def put_nowait(self, obj):
+        self.put(obj, False)
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        removes and returns the first element of the queue; raises queue.Empty if no element is
+        available within timeout seconds or immediately if block is False
+        """
+        if not self._items.acquire(block, timeout):
+            raise queue.Empty
+        self._get_lock.acquire()
+        head = _Offset.unpack_from(self._shm.buf, 0)[0]
+        length = _Length.unpack(self._read(head, _Length.size))[0]
+        data = self._read(head + _Length.size, length)
+        _Offset.pack_into(self._shm.buf, 0, head + _Length.size + length)
+        self._get_lock.release()
+        if self._loads is None:
+            return pickle.loads(data)
+        return self._loads(data)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self) -> int:
+        """
+        returns the number of bytes currently stored in the buffer
+        """
+        head, tail = _Header.unpack_from(self._shm.buf, 0)
+        return tail - head
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def close(self):
+        """
+        releases the shared memory; it is removed if called by the creating process
+        """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _write(self, pos: int, data: bytes):
+        start = _Header.size + pos % self.capacity
+        first = min(len(data), _Header.size + self.capacity - start)
+        self._shm.buf[start:start+first] = data[:first]
+        if first < len(data):
+            self._shm.buf[_Header.size:_Header.size+len(data)-first] = data[first:]
+
+    def _read(self, pos: int, length: int) -> bytes:
+        start = _Header.size + pos % self.capacity
+        first = min(length, _Header.size + self.capacity - start)
+        data = bytes(self._shm.buf[start:start+first])
+        if first < length:
+            data += bytes(self._shm.buf[_Header.size:_Header.size+length-first])
+        return data
+
+
+def _echo(q_in, q_out):
+    while True:
+        obj = q_in.get()
+        if obj is None:
+            break
+        q_out.put(obj)
+
+
+def benchmark(new_queue, num: int = 10000) -> tuple:
+    """
+    measures the round trip time and the throughput of a queue type with ACL messages; new_queue
+    is called to create a queue
+    """
+    import clonemapy.datamodels as datamodels
+    q_req = new_queue()
+    q_resp = new_queue()
+    p = multiprocessing.Process(target=_echo, args=(q_req, q_resp,))
+    p.start()
+    msg = datamodels.ACLMessage(sender=0, receiver=1, content="benchmark message", prot=1, perf=8)
+    for i in range(100):
+        q_req.put(msg)
+        q_resp.get()
+    tstart = time.perf_counter()
+    for i in range(num):
+        q_req.put(msg)
+        q_resp.get()
+    rtt = (time.perf_counter() - tstart) / num
+    tstart = time.perf_counter()
+    for i in range(num):
+        q_req.put(msg)
+        if i >= 100:
+            q_resp.get()
+    for i in range(100):
+        q_resp.get()
+    rate = num / (time.perf_counter() - tstart)
+    q_req.put(None)
+    p.join()
+    if isinstance(q_req, ShmQueue):
+        q_req.close()
+        q_resp.close()
+    return rtt, rate
+
+
+if __name__ == "__main__":
+    rtt, rate = benchmark(lambda: multiprocessing.Queue(1000))
+    print("multiprocessing.Queue: RTT: "+str(int(rtt*1000000))+" µs, Throughput: " +
+          str(int(rate))+" msgs/s")
+    rtt, rate = benchmark(lambda: ShmQueue())
+    print("ShmQueue: RTT: "+str(int(rtt*1000000))+" µs, Throughput: " +
+          str(int(rate))+" msgs/s")
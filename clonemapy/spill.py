@@ -0,0 +1,260 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a disk-backed buffer for records which cannot be sent right away, e.g.
+logs and time series data while the logger is slow or unavailable.
+
+Records are appended to memory-mapped, append-only segment files of fixed size. Each record is
+stored as length-prefixed frame. The first bytes of a segment hold the offset of the first record
+which has not been read yet, such that records which remain after a restart are replayed. Fully
+read segments are deleted. The total size of all segments is limited by a quota; if it is
+exceeded, either the new record (drop-newest) or the oldest segment (drop-oldest) is dropped.
+"""
+import mmap
+import os
+import struct
+
+_Offset = struct.Struct("Q")
+_Length = struct.Struct("I")
+
+
+class Segment():
+    """
+    memory-mapped segment file
+
+    Attributes
+    ----------
+    path : str
+           path of the segment file
+    size : integer
+           size of the segment file in bytes
+    read : integer
+           offset of the first unread record
+    write : integer
+            offset at which the next record is appended
+    count : integer
+            number of unread records
+    """
+    def __init__(self, path: str, size: int = 0):
+        super().__init__()
+        self.path = path
+        create = not os.path.exists(path)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            self._mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        if create:
+            self.read = _Offset.size
+            _Offset.pack_into(self._mm, 0, self.read)
+        else:
+            self.read = _Offset.unpack_from(self._mm, 0)[0]
+        # find end of existing records
+        self.write = self.read
+        self.count = 0
+        while self.write + _Length.size <= self.size:
+            length = _Length.unpack_from(self._mm, self.write)[0]
+            if length == 0 or self.write + _Length.size + length > self.size:
+                break
+            self.write += _Length.size + length
+            self.count += 1
+
+    def append(self, data: bytes) -> bool:
+        """
+        appends one record; returns False if the segment is full
+        """
+        end = self.write + _Length.size + len(data)
+        if end > self.size:
+            return False
+        self._mm[self.write + _Length.size:end] = data
+        _Length.pack_into(self._mm, self.write, len(data))
+        self.write = end
+        self.count += 1
+        return True
+
+    def peek(self) -> bytes:
+        """
+        returns the first unread record or None
+        """
+        if self.count == 0:
+            return None
+        length = _Length.unpack_from(self._mm, self.read)[0]
+        return bytes(self._mm[self.read + _Length.size:self.read + _Length.size + length])
+
+    def pop(self):
+        """
+        marks the first unread record as read
+        """
+        if self.count == 0:
+            return
+        length = _Length.unpack_from(self._mm, self.read)[0]
+        self.read += _Length.size + length
+        self.count -= 1
+        _Offset.pack_into(self._mm, 0, self.read)
+
+    def close(self):
+        self._mm.close()
+
+    def remove(self):
+        self._mm.close()
+        os.remove(self.path)
+
+
+class SpillBuffer():
+    """
+    FIFO buffer of records stored in segment files within a directory; existing segments are
+    loaded when the buffer is created; the buffer is not thread-safe
+
+    Attributes
+    ----------
+    directory : str
+                directory of the segment files
+    segment_size : integer
+                   size of each segment file in bytes
+    quota : integer
+            maximum size of all segment files in bytes
+    policy : str
+             drop-newest or drop-oldest
+    """
+    def __init__(self, directory: str, segment_size: int = 4 << 20, quota: int = 256 << 20,
+                 policy: str = "drop-oldest"):
+        super().__init__()
+        self.directory = directory
+        self.segment_size = segment_size
+        self.quota = quota
+        self.policy = policy
+        self._segments = []
+        self._seq = 0
+        self._peeked = None
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        names = sorted([i for i in os.listdir(directory) if i.endswith(".seg")])
+        for i in names:
+            seg = Segment(os.path.join(directory, i))
+            self._seq = max(self._seq, int(i[:-4]) + 1)
+            if seg.count == 0:
+                seg.remove()
+                continue
+            self._segments.append(seg)
+        # existing segments are only read; records are appended to new segments
+        self._writable = False
+
+    def __len__(self) -> int:
+        count = 0
+        for i in self._segments:
+            count += i.count
+        return count
+
+    def disk_usage(self) -> int:
+        size = 0
+        for i in self._segments:
+            size += i.size
+        return size
+
+    def append(self, data: bytes) -> bool:
+        """
+        appends one record; returns False if the record was dropped
+        """
+        if self._writable and self._segments[-1].append(data):
+            self.spilled += 1
+            return True
+        size = max(self.segment_size, _Offset.size + _Length.size + len(data))
+        while self.disk_usage() + size > self.quota:
+            if self.policy != "drop-oldest" or len(self._segments) == 0:
+                self.dropped += 1
+                return False
+            seg = self._segments.pop(0)
+            self.dropped += seg.count
+            seg.remove()
+        path = os.path.join(self.directory, "%012d.seg" % self._seq)
+        self._seq += 1
+        self._segments.append(Segment(path, size))
+        self._writable = True
+        self._segments[-1].append(data)
+        self.spilled += 1
+        return True
+
+    def peek(self) -> bytes:
+        """
+        returns the oldest record or None if the buffer is empty
+        """
+        while len(self._segments) > 0:
+            data = self._segments[0].peek()
+            if data is not None:
+                self._peeked = (self._segments[0], self._segments[0].read)
+                return data
+            if len(self._segments) == 1 and self._writable:
+                return None
+            self._segments.pop(0).remove()
+        return None
+
+    def pop(self):
+        """
+        removes the record returned by the last call of peek (after it has been processed
+        successfully) unless it has been dropped in the meantime
+        """
+        if self._peeked is None or len(self._segments) == 0:
+            return
+        seg, offset = self._peeked
+        self._peeked = None
+        if self._segments[0] is seg and seg.read == offset:
+            seg.pop()
+            self.replayed += 1
+
+    def close(self):
+        for i in self._segments:
+            i.close()
+        self._segments = []
+        self._writable = False
+
+    def stats(self) -> dict:
+        """
+        returns the number of spilled, replayed and dropped records as well as the number of
+        records and bytes on disk
+        """
+        return {'spilled': self.spilled, 'replayed': self.replayed, 'dropped': self.dropped,
+                'records': len(self), 'disk_bytes': self.disk_usage()}
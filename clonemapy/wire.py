@@ -0,0 +1,176 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a compact binary encoding of ACL messages.
+
+The encoding is used for the transfer of messages among processes (ACLMessage objects are pickled
+with it) and optionally among agencies (Content-Type application/x-clonemap-acl) which advertise
+it in the Accept-Post header of their responses. It consists of a fixed header with all integer
+fields and the timestamp followed by the string fields, each of them prefixed with its length. A
+comparison with JSON and pickle is run by python -m clonemapy.wire.
+"""
+import struct
+from datetime import datetime, timedelta, timezone
+import clonemapy.datamodels as datamodels
+
+ContentType = "application/x-clonemap-acl"
+
+_Version = 1
+# version, flags, perf, prot, sender, receiver, repto, convid, timestamp in µs
+_Header = struct.Struct("<BBiiqqqqq")
+_Length = struct.Struct("<I")
+_FlagUTC = 1
+_FlagRepto = 2
+_FlagConvid = 4
+_NoString = 0xFFFFFFFF
+_Strings = ("agencys", "agencyr", "content", "lang", "enc", "ont", "repwith", "inrepto", "repby")
+_Epoch = datetime(1970, 1, 1)
+_EpochUTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_Microsecond = timedelta(microseconds=1)
+
+
+def encode_msg(msg: datamodels.ACLMessage) -> bytes:
+    """
+    returns binary representation of message
+    """
+    flags = 0
+    if msg.ts.tzinfo is None:
+        ts = (msg.ts - _Epoch) // _Microsecond
+    else:
+        flags |= _FlagUTC
+        ts = (msg.ts - _EpochUTC) // _Microsecond
+    repto = 0
+    if msg.repto is not None:
+        flags |= _FlagRepto
+        repto = msg.repto
+    convid = 0
+    if msg.convid is not None:
+        flags |= _FlagConvid
+        convid = msg.convid
+    parts = [_Header.pack(_Version, flags, msg.perf, msg.prot, msg.sender, msg.receiver, repto,
+                          convid, ts)]
+    for i in _Strings:
+        val = getattr(msg, i)
+        if val is None:
+            parts.append(_Length.pack(_NoString))
+        else:
+            val = val.encode()
+            parts.append(_Length.pack(len(val)))
+            parts.append(val)
+    return b"".join(parts)
+
+
+def decode_msg(data: bytes, offset: int = 0) -> datamodels.ACLMessage:
+    """
+    creates message from its binary representation
+    """
+    msg, offset = _decode(memoryview(data), offset)
+    return msg
+
+
+def encode_msgs(msgs: list) -> bytes:
+    """
+    returns binary representation of a list of messages
+    """
+    parts = [_Length.pack(len(msgs))]
+    for i in msgs:
+        parts.append(encode_msg(i))
+    return b"".join(parts)
+
+
+def decode_msgs(data: bytes) -> list:
+    """
+    creates list of messages from its binary representation
+    """
+    buf = memoryview(data)
+    num = _Length.unpack_from(buf, 0)[0]
+    offset = _Length.size
+    msgs = []
+    for i in range(num):
+        msg, offset = _decode(buf, offset)
+        msgs.append(msg)
+    return msgs
+
+
+def _decode(buf: memoryview, offset: int) -> tuple:
+    version, flags, perf, prot, sender, receiver, repto, convid, ts = _Header.unpack_from(buf,
+                                                                                          offset)
+    if version != _Version:
+        raise ValueError("unknown version of message encoding: "+str(version))
+    offset += _Header.size
+    fields = {'perf': perf, 'prot': prot, 'sender': sender, 'receiver': receiver}
+    if flags & _FlagUTC:
+        fields['ts'] = _EpochUTC + ts * _Microsecond
+    else:
+        fields['ts'] = _Epoch + ts * _Microsecond
+    fields['repto'] = repto if flags & _FlagRepto else None
+    fields['convid'] = convid if flags & _FlagConvid else None
+    for i in _Strings:
+        length = _Length.unpack_from(buf, offset)[0]
+        offset += _Length.size
+        if length == _NoString:
+            fields[i] = None
+        else:
+            fields[i] = str(buf[offset:offset+length], 'utf-8')
+            offset += length
+    return datamodels.ACLMessage.construct(**fields), offset
+
+
+if __name__ == "__main__":
+    import json
+    import pickle
+    import time
+    msg = datamodels.ACLMessage(sender=0, receiver=1, content="benchmark message", prot=1, perf=8)
+    num = 10000
+    tstart = time.perf_counter()
+    for i in range(num):
+        js = json.dumps([json.loads(msg.json())])
+        datamodels.ACLMessage.parse_obj(json.loads(js)[0])
+    tjson = (time.perf_counter() - tstart) / num
+    tstart = time.perf_counter()
+    for i in range(num):
+        decode_msgs(encode_msgs([msg]))
+    tbin = (time.perf_counter() - tstart) / num
+    print("JSON: "+str(len(js))+" bytes, "+str(int(tjson*1000000))+" µs per message")
+    print("binary: "+str(len(encode_msgs([msg])))+" bytes, "+str(int(tbin*1000000)) +
+          " µs per message")
+    print("pickle: "+str(len(pickle.dumps(msg)))+" bytes")
@@ -0,0 +1,473 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the agency
+"""
+import http.client
+import json
+import queue
+import socket
+import threading
+import time
+import types
+import pytest
+import requests
+from clonemapy import agency, agent, httpclient, wire
+import clonemapy.datamodels as datamodels
+
+
+def test_collect_batch_size():
+    q = queue.Queue()
+    for i in range(5):
+        q.put(i)
+    assert agency.collect_batch(q, 3, 0) == [0, 1, 2]
+    assert agency.collect_batch(q, 3, 0) == [3, 4]
+
+
+def test_collect_batch_waits_for_first():
+    q = queue.Queue()
+    timer = threading.Timer(0.05, q.put, args=(1,))
+    timer.start()
+    assert agency.collect_batch(q, 3, 0) == [1]
+    timer.join()
+
+
+def test_collect_batch_delay():
+    q = queue.Queue()
+    q.put(0)
+    timer = threading.Timer(0.05, q.put, args=(1,))
+    timer.start()
+    start = time.monotonic()
+    assert agency.collect_batch(q, 3, 1) == [0, 1]
+    # the batch is not complete, so the whole delay is waited for
+    assert time.monotonic() - start >= 1
+    timer.join()
+    q.put(2)
+    q.put(3)
+    start = time.monotonic()
+    assert agency.collect_batch(q, 2, 5) == [2, 3]
+    assert time.monotonic() - start < 1
+
+
+class Info:
+    def json(self) -> str:
+        return '{"name": "agency-0"}'
+
+
+class FakeAgency:
+    """
+    stands in for the agency behind the http api
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.info = Info()
+        self.delay = 0
+        self.local_agents = {}
+        self.ready = set()
+
+    def metrics(self) -> dict:
+        time.sleep(self.delay)
+        return {'agents': 0}
+
+    def is_ready(self, agentid: int) -> bool:
+        return agentid in self.ready
+
+    def create_agents(self, agentinfos: list) -> list:
+        results = []
+        for i in agentinfos:
+            code = 409 if i.id in self.local_agents else 201
+            self.local_agents[i.id] = None
+            results.append({'id': i.id, 'code': code, 'error': ""})
+        return results
+
+
+def start_server(workers: int, keepalive: float = 30) -> agency.AgencyServer:
+    srv = agency.AgencyServer(("127.0.0.1", 0), agency.AgencyHandler, workers, keepalive)
+    srv.agency = FakeAgency()
+    x = threading.Thread(target=srv.serve_forever, daemon=True)
+    x.start()
+    return srv
+
+
+@pytest.fixture
+def server():
+    srv = start_server(2)
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def connect(srv: agency.AgencyServer) -> http.client.HTTPConnection:
+    return http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=10)
+
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, body=None) -> tuple:
+    conn.request(method, path, body)
+    resp = conn.getresponse()
+    return resp.status, resp.read()
+
+
+def test_keepalive(server):
+    conn = connect(server)
+    for i in range(3):
+        assert request(conn, "GET", "/api/agency") == (200, b'{"name": "agency-0"}')
+    assert request(conn, "GET", "/api/unknown")[0] == 405
+    conn.close()
+
+
+def test_concurrent_requests(server):
+    server.agency.delay = 0.5
+    slow = connect(server)
+    slow.request("GET", "/api/agency/metrics")
+    # the slow request occupies one worker only
+    time.sleep(0.05)
+    start = time.monotonic()
+    conn = connect(server)
+    assert request(conn, "GET", "/api/agency")[0] == 200
+    assert time.monotonic() - start < 0.4
+    resp = slow.getresponse()
+    assert json.loads(resp.read()) == {'agents': 0}
+    slow.close()
+    conn.close()
+
+
+def test_idle_connections():
+    srv = start_server(1, 0.5)
+    try:
+        idle = []
+        for i in range(3):
+            conn = connect(srv)
+            assert request(conn, "GET", "/api/agency")[0] == 200
+            idle.append(conn)
+        # idle keep-alive connections do not occupy the worker
+        start = time.monotonic()
+        conn = connect(srv)
+        assert request(conn, "GET", "/api/agency")[0] == 200
+        assert time.monotonic() - start < 0.4
+        # idle connections are closed after the keep-alive timeout
+        time.sleep(2)
+        assert idle[0].sock.recv(1) == b""
+        for i in idle:
+            i.close()
+        conn.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_silent_connections(server):
+    # connections without a request do not occupy the workers
+    silent = []
+    for i in range(3):
+        silent.append(socket.create_connection(server.server_address, timeout=10))
+    start = time.monotonic()
+    conn = connect(server)
+    assert request(conn, "GET", "/api/agency")[0] == 200
+    assert time.monotonic() - start < 1
+    conn.close()
+    for i in silent:
+        i.close()
+
+
+class Peer:
+    """
+    stands in for the queue of a remote agency
+    """
+    def __init__(self):
+        self.msgs = []
+
+    def put(self, msg: datamodels.ACLMessage):
+        self.msgs.append(msg)
+
+
+class Resolver:
+    """
+    records the address requests instead of executing them
+    """
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, func, *args):
+        self.calls.append((func, args))
+
+
+def new_agency() -> agency.Agency:
+    """
+    returns an agency without agents, http server and threads
+    """
+    ag = object.__new__(agency.Agency)
+    ag.info = types.SimpleNamespace(masid=0, name="agency-0")
+    ag.lock = threading.Lock()
+    ag.local_agents = {}
+    ag.parked = {}
+    ag.remote_agents = agency.AddressCache(100, 0)
+    ag.remote_agencies = {"agency-1": Peer(), "agency-2": Peer()}
+    ag.runtime = None
+    ag.resolver = Resolver()
+    return ag
+
+
+def new_msg(receiver: int, content: str = "x") -> datamodels.ACLMessage:
+    return datamodels.ACLMessage(sender=1, receiver=receiver, content=content)
+
+
+def test_park_and_resolve(monkeypatch):
+    ag = new_agency()
+    monkeypatch.setattr(agency.ams, "get_agent_address",
+                        lambda host, masid, agentid: datamodels.Address(agency="agency-1"))
+    msgs = [new_msg(5, str(i)) for i in range(2)]
+    ag.park_msg(msgs[0])
+    ag.park_msg(msgs[1])
+    # one address request per agent
+    assert len(ag.resolver.calls) == 1
+    func, args = ag.resolver.calls[0]
+    func(*args)
+    assert ag.remote_agencies["agency-1"].msgs == msgs
+    assert ag.parked == {}
+    assert ag.remote_agents.get(5) == "agency-1"
+
+
+def test_park_resolved():
+    ag = new_agency()
+    # the address was published after the sender looked it up
+    ag.remote_agents.put(5, "agency-2")
+    msg = new_msg(5)
+    ag.park_msg(msg)
+    assert ag.remote_agencies["agency-2"].msgs == [msg]
+    assert ag.resolver.calls == []
+    assert ag.parked == {}
+
+
+def test_resolve_stale(monkeypatch):
+    ag = new_agency()
+    monkeypatch.setattr(agency.ams, "get_agent_address",
+                        lambda host, masid, agentid: datamodels.Address(agency="agency-1"))
+    ag.remote_agents.put(5, "agency-1")
+    ag.handle_failed_msgs("agency-1", [new_msg(5)])
+    assert 5 not in ag.remote_agents
+    func, args = ag.resolver.calls[0]
+    func(*args)
+    # the agent is still located in the unreachable agency -> message is dropped
+    assert ag.remote_agencies["agency-1"].msgs == []
+    assert ag.parked == {}
+    assert 5 not in ag.remote_agents
+
+
+def test_address_cache_lru():
+    cache = agency.AddressCache(2, 0)
+    cache.put(1, "agency-1")
+    cache.put(2, "agency-2")
+    assert cache.get(1) == "agency-1"
+    # agent 2 is the least recently used entry
+    cache.put(3, "agency-3")
+    assert cache.get(2) is None
+    assert cache.get(1) == "agency-1"
+    assert cache.get(3) == "agency-3"
+    assert cache.stats() == {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1,
+                             'invalidations': 0}
+
+
+def test_address_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = agency.AddressCache(10, 5)
+    cache.put(1, "agency-1")
+    now[0] += 4
+    assert cache.get(1) == "agency-1"
+    now[0] += 2
+    assert cache.get(1) is None
+    assert 1 not in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_address_cache_invalidate():
+    cache = agency.AddressCache(10, 0)
+    cache.put(1, "agency-1")
+    # entries are only removed if they point to the failed agency
+    cache.invalidate(1, "agency-2")
+    assert cache.get(1) == "agency-1"
+    cache.invalidate(1, "agency-1")
+    assert cache.get(1) is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_agent_status(server):
+    server.agency.local_agents = {1: None, 2: None}
+    server.agency.ready.add(2)
+    conn = connect(server)
+    status, body = request(conn, "GET", "/api/agency/agents/1/status")
+    assert status == 200
+    assert json.loads(body)['code'] == datamodels.StatusCode.Starting.value
+    status, body = request(conn, "GET", "/api/agency/agents/2/status")
+    assert json.loads(body)['code'] == datamodels.StatusCode.Running.value
+    assert request(conn, "GET", "/api/agency/agents/3/status")[0] == 404
+    conn.close()
+
+
+def test_wait_ready():
+    ag = new_agency()
+    ag.ready = queue.Queue()
+    ag.ready_cond = threading.Condition()
+    ag.ready_agents = set()
+    ag.counters = [7] * len(agent.Counters)
+    ag.free_slots = []
+    x = threading.Thread(target=ag.receive_ready, daemon=True)
+    x.start()
+    assert not ag.wait_ready([1, 2], 0.05)
+    ag.ready.put(1)
+    ag.ready.put(2)
+    assert ag.wait_ready([1, 2], 5)
+    assert ag.is_ready(1)
+    # a worker reports that a stopped agent has ended
+    ag.ready.put(("stopped", 0))
+    deadline = time.monotonic() + 5
+    while len(ag.free_slots) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ag.free_slots == [0]
+    assert ag.counters == [0] * len(agent.Counters)
+
+
+def agent_info(agentid: int) -> dict:
+    return {'spec': {'nodeid': 0, 'name': "agent"}, 'masid': 0, 'agencyid': 0, 'imid': 0,
+            'id': agentid, 'address': {'agency': "agency-0"},
+            'status': {'code': 1, 'lastupdate': "2021-01-01T00:00:00Z"}}
+
+
+def test_post_agent_list(server):
+    server.agency.local_agents = {1: None}
+    conn = connect(server)
+    status, body = request(conn, "POST", "/api/agency/agents/list",
+                           json.dumps([agent_info(1), agent_info(2)]))
+    assert status == 201
+    assert [i['code'] for i in json.loads(body)] == [409, 201]
+    conn.close()
+
+
+@pytest.mark.parametrize("path,body", [
+    ("/api/agency/agents/list", b"[{"),
+    ("/api/agency/agents/list", b'[{"id": 1}]'),
+    ("/api/agency/agents", b"{}"),
+    ("/api/agency/msgs", b"not json"),
+])
+def test_post_malformed(server, path, body):
+    conn = connect(server)
+    assert request(conn, "POST", path, body)[0] == 400
+    # the connection is kept alive
+    assert request(conn, "GET", "/api/agency")[0] == 200
+    conn.close()
+
+
+def test_post_msgs_advertised(server):
+    conn = connect(server)
+    conn.request("POST", "/api/agency/msgs", b"[]")
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.status == 201
+    assert wire.ContentType in resp.getheader("Accept-Post")
+    assert resp.getheader("Accept-Encoding") == "gzip, deflate"
+    conn.request("POST", "/api/agency/msgs", b"[]", {"Content-Encoding": "br"})
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.status == 415
+    assert resp.getheader("Accept-Encoding") == "gzip, deflate"
+    conn.close()
+
+
+class FakePost:
+    """
+    stands in for httpclient.post; records content type and compression of the requests and
+    answers with the given headers and status codes
+    """
+    def __init__(self, headers: dict, codes: list = None):
+        self.headers = headers
+        self.codes = codes or []
+        self.sent = []
+        self.error = False
+
+    def __call__(self, url: str, data=None, headers=None, compress=False):
+        self.sent.append((headers.get('Content-Type', ""), compress))
+        if self.error:
+            raise requests.exceptions.ConnectionError("connection reset")
+        code = self.codes.pop(0) if len(self.codes) > 0 else 201
+        return types.SimpleNamespace(status_code=code,
+                                     headers=requests.structures.CaseInsensitiveDict(self.headers))
+
+
+@pytest.fixture
+def negotiation(monkeypatch):
+    monkeypatch.setattr(agency, "MsgEncoding", "binary")
+    monkeypatch.setattr(httpclient, "Compression", "gzip")
+    monkeypatch.setattr(agency, "_accepted", {})
+    monkeypatch.setattr(agency, "_json_agencies", set())
+
+
+def test_post_msgs_not_advertised(monkeypatch, negotiation):
+    post = FakePost({})
+    monkeypatch.setattr(httpclient, "post", post)
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    # peers without support only receive uncompressed JSON
+    assert post.sent == [("", False), ("", False)]
+
+
+def test_post_msgs_negotiated(monkeypatch, negotiation):
+    post = FakePost(agency.MsgHeaders)
+    monkeypatch.setattr(httpclient, "post", post)
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert post.sent == [("", False), (wire.ContentType, True)]
+    # the advertisement is forgotten if the connection fails
+    post.error = True
+    assert not agency.post_msgs("agency-1", [new_msg(1)])
+    post.error = False
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert post.sent[3:] == [("", False)]
+
+
+def test_post_msgs_rejected(monkeypatch, negotiation):
+    post = FakePost(agency.MsgHeaders, [201, 415])
+    monkeypatch.setattr(httpclient, "post", post)
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert post.sent == [("", False), (wire.ContentType, True), ("", True)]
+    assert agency.post_msgs("agency-1", [new_msg(1)])
+    assert post.sent[3] == ("", True)
@@ -0,0 +1,308 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the overflow policies and the limits of msg logs
+"""
+import pickle
+import queue
+import threading
+import time
+from multiprocessing import RawArray
+import pytest
+import clonemapy.agent as agent
+import clonemapy.datamodels as datamodels
+
+
+def full_queue(items: list) -> queue.Queue:
+    q = queue.Queue(len(items))
+    for i in items:
+        q.put(i)
+    return q
+
+
+def test_enqueue_drop_newest():
+    counters = [0, 0]
+    q = full_queue([1, 2])
+    assert not agent.enqueue(q, 3, "drop-newest", counters, 0)
+    assert list(q.queue) == [1, 2]
+    assert counters == [1, 0]
+
+
+def test_enqueue_drop_oldest():
+    counters = [0, 0]
+    q = full_queue([1, 2])
+    assert agent.enqueue(q, 3, "drop-oldest", counters, 0)
+    assert list(q.queue) == [2, 3]
+    assert counters == [1, 0]
+    # a shared queue must not lose items of other agents
+    assert not agent.enqueue(q, 4, "drop-oldest", counters, 0, shared=True)
+    assert list(q.queue) == [2, 3]
+    assert counters == [2, 0]
+
+
+def test_enqueue_sample(monkeypatch):
+    monkeypatch.setattr(agent, "SampleRate", 3)
+    monkeypatch.setattr(agent, "_overflows", {})
+    counters = [0, 0]
+    q = full_queue([1])
+    assert not agent.enqueue(q, 2, "sample", counters, 0)
+    assert not agent.enqueue(q, 3, "sample", counters, 0)
+    # every third overflow waits for free space
+    timer = threading.Timer(0.05, q.get)
+    timer.start()
+    assert agent.enqueue(q, 4, "sample", counters, 0)
+    timer.join()
+    assert list(q.queue) == [4]
+    assert counters == [2, 1]
+
+
+def test_enqueue_block():
+    counters = [0, 0]
+    q = queue.Queue(1)
+    assert agent.enqueue(q, 1, "block", counters, 0)
+    assert counters == [0, 0]
+    assert list(q.queue) == [1]
+
+
+def new_logger(rate: float, burst: float = None, sample: float = None) -> agent.Logger:
+    logger = agent.Logger(0, 0, None, None)
+    flags = RawArray('d', agent.NumLogFlags)
+    agent.set_log_flags(flags, datamodels.LoggerConfig(msg=True, msgrate=rate, msgburst=burst,
+                                                       msgsample=sample))
+    logger._set_log_flags(flags)
+    logger._set_counters(RawArray('q', len(agent.Counters)), 0)
+    return logger
+
+
+def test_msg_log_token_bucket(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    logger = new_logger(2, 3)
+    admitted = [logger._admit_msg_log("ACL send") for i in range(5)]
+    assert admitted == [True, True, True, False, False]
+    # buckets are kept per message type
+    assert logger._admit_msg_log("ACL receive")
+    now[0] += 1
+    admitted = [logger._admit_msg_log("ACL send") for i in range(3)]
+    assert admitted == [True, True, False]
+    assert logger._counters[agent.Counters["msg_log_suppressed"]] == 3
+
+
+def test_msg_log_defaults():
+    logger = new_logger(0)
+    assert all(logger._admit_msg_log("ACL send") for i in range(100))
+    logger = new_logger(5)
+    assert logger._log_flags[agent.MsgLogBurst] == 5
+    logger = new_logger(0, sample=0)
+    assert not logger._admit_msg_log("ACL send")
+
+
+def new_acl(agentid: int) -> agent.ACL:
+    """
+    returns the ACL of an agent whose queues are not connected to an agency
+    """
+    log = agent.Logger(0, agentid, queue.Queue(), queue.Queue())
+    log._set_counters(RawArray('q', 4*len(agent.Counters)), agentid)
+    return agent.ACL(agentid, queue.Queue(), queue.Queue(), None, log)
+
+
+def counter(acl: agent.ACL, slot: int, name: str) -> int:
+    return acl._logger._counters[slot*len(agent.Counters) + agent.Counters[name]]
+
+
+def test_direct_path_overflow(monkeypatch):
+    monkeypatch.setattr(agent, "MsgOverflow", "drop-newest")
+    acl = new_acl(1)
+    q = full_queue([None])
+    acl._set_local_agents({2: (q, 2, False)}, "agency-0")
+    acl.send_message(datamodels.ACLMessage(receiver=2, content="a"))
+    # the message is dropped and counted for the receiver instead of blocking the sender
+    assert list(q.queue) == [None]
+    assert counter(acl, 2, "msg_dropped") == 1
+    assert acl._msg_out.empty()
+    acl._stop()
+
+
+def test_direct_path_block(monkeypatch):
+    monkeypatch.setattr(agent, "MsgOverflow", "block")
+    acl = new_acl(1)
+    q = full_queue([None])
+    acl._set_local_agents({2: (q, 2, False)}, "agency-0")
+    timer = threading.Timer(0.05, q.get)
+    timer.start()
+    acl.send_message(datamodels.ACLMessage(receiver=2, content="a"))
+    timer.join()
+    assert q.get(block=False).content == "a"
+    assert counter(acl, 2, "msg_delayed") == 1
+    # the agency delivers the message if the receiver is removed while the sender waits
+    q.put(None)
+    ctrl = datamodels.ACLMessage(sender=-1, receiver=1, prot=-2, content="2")
+    timer = threading.Timer(0.05, acl._msg_in.put, args=(ctrl,))
+    timer.start()
+    acl.send_message(datamodels.ACLMessage(receiver=2, content="b"))
+    timer.join()
+    assert acl._msg_out.get(block=False).content == "b"
+    acl._stop()
+
+
+def test_direct_path_copy():
+    acl = new_acl(1)
+    inboxes = {2: queue.Queue(), 3: queue.Queue()}
+    acl._set_local_agents({2: (inboxes[2], 2, False), 3: (inboxes[3], 3, False)}, "agency-0")
+    msg = datamodels.ACLMessage(receiver=2, content="hello 2")
+    acl.send_message(msg)
+    msg.receiver = 3
+    msg.content = "hello 3"
+    acl.send_message(msg)
+    # agents in the same process must not share the message object
+    msg2 = inboxes[2].get(block=False)
+    msg3 = inboxes[3].get(block=False)
+    assert (msg2.receiver, msg2.content) == (2, "hello 2")
+    assert (msg3.receiver, msg3.content) == (3, "hello 3")
+    assert msg2 is not msg3 and msg3 is not msg
+    acl._stop()
+
+
+def test_msg_log_snapshot():
+    acl = new_acl(1)
+    msg = datamodels.ACLMessage(receiver=2, content="hello 2", prot=3, perf=6)
+    acl.send_message(msg)
+    msg.content = "hello 3"
+    log = acl._logger._log_out.get(block=False)
+    # the log is pickled into the log queue of the agency and rendered there
+    log = pickle.loads(pickle.dumps(log)).render()
+    assert log.msg == "ACL send"
+    assert log.data == str(datamodels.ACLMessage(sender=1, receiver=2, content="hello 2", prot=3,
+                                                 perf=6, ts=msg.ts))
+    acl._stop()
+
+
+def connect_acls(acl1: agent.ACL, acl2: agent.ACL):
+    acl1._set_local_agents({acl2._id: (acl2._msg_in, -1, False)}, "agency-0")
+    acl2._set_local_agents({acl1._id: (acl1._msg_in, -1, False)}, "agency-0")
+
+
+def reply(acl: agent.ACL, content: str, use_convid: bool = False):
+    """
+    answers the next received message
+    """
+    msg = acl.recv_message_wait()
+    ans = datamodels.ACLMessage(receiver=msg.sender, content=content, convid=msg.convid)
+    if not use_convid:
+        ans.inrepto = msg.repwith
+    acl.send_message(ans)
+
+
+@pytest.mark.parametrize("use_convid", [False, True])
+def test_request(use_convid):
+    acl1 = new_acl(1)
+    acl2 = new_acl(2)
+    connect_acls(acl1, acl2)
+    x = threading.Thread(target=reply, args=(acl2, "pong", use_convid))
+    x.start()
+    ans = acl1.request(datamodels.ACLMessage(receiver=2, content="ping"), 5)
+    x.join()
+    assert ans.content == "pong"
+    # replies are not put into the mailbox and the request is not pending anymore
+    assert acl1.recv_messages() == []
+    assert acl1._requests == {} and acl1._conversations == {}
+    acl1._stop()
+    acl2._stop()
+
+
+def test_request_timeout():
+    acl1 = new_acl(1)
+    acl2 = new_acl(2)
+    connect_acls(acl1, acl2)
+    assert acl1.request(datamodels.ACLMessage(receiver=2, content="ping"), 0.05) is None
+    assert acl1._requests == {}
+    # late replies are received like any other message
+    reply(acl2, "pong")
+    assert acl1.recv_message_filter({"sender": 2}, 5).content == "pong"
+    acl1._stop()
+    acl2._stop()
+
+
+def test_request_cancelled_while_matched():
+    acl = new_acl(1)
+    fut = acl.request_async(datamodels.ACLMessage(receiver=2, content="ping"))
+    match = acl._match_request
+
+    def match_and_cancel(msg):
+        # the request times out in another thread after the reply has been matched
+        ret = match(msg)
+        x.start()
+        while not fut.cancelled():
+            time.sleep(0.001)
+        return ret
+
+    x = threading.Thread(target=fut.cancel)
+    acl._match_request = match_and_cancel
+    msg = acl._msg_out.get(block=False)
+    acl._route_message(datamodels.ACLMessage(sender=2, receiver=1, content="pong",
+                                             inrepto=msg.repwith))
+    x.join()
+    assert acl.recv_message_filter({"sender": 2}, 0).content == "pong"
+    acl._stop()
+
+
+def test_request_pending_repwith():
+    acl = new_acl(1)
+    acl.request_async(datamodels.ACLMessage(receiver=2, content="ping", repwith="r"))
+    with pytest.raises(ValueError):
+        acl.request_async(datamodels.ACLMessage(receiver=2, content="ping", repwith="r"))
+    acl._stop()
+
+
+@pytest.mark.parametrize("policy", ["drop-newest", "sample"])
+def test_state_not_dropped(monkeypatch, policy):
+    monkeypatch.setattr(agent, "LogOverflow", policy)
+    monkeypatch.setattr(agent, "_overflows", {})
+    log = agent.Logger(0, 1, full_queue([None]), None)
+    log.new_log("app", "dropped", "")
+    assert list(log._log_out.queue) == [None]
+    # the latest state waits for free space
+    timer = threading.Timer(0.05, log._log_out.get)
+    timer.start()
+    log.update_state("latest")
+    timer.join()
+    assert log._log_out.get(block=False).state == "latest"
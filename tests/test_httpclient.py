@@ -0,0 +1,168 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the pooled http client and the compression of request bodies
+"""
+import http.server
+import os
+import threading
+import pytest
+from clonemapy import httpclient
+
+
+def test_session_per_host():
+    try:
+        sess = httpclient.session("http://ams:9000/api/clonemap")
+        assert httpclient.session("http://ams:9000/api/clonemap/mas") is sess
+        assert httpclient.session("http://logger:11000/api/logging") is not sess
+        assert httpclient.stats()["ams:9000"]['requests'] == 2
+    finally:
+        httpclient.close()
+    assert httpclient.stats() == {}
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_reset_after_fork():
+    sess = httpclient.session("http://ams:9000/api/clonemap")
+    # the lock is held by the parent while forking
+    httpclient._lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        ok = httpclient.session("http://ams:9000/api/clonemap") is not sess
+        os._exit(0 if ok else 1)
+    httpclient._lock.release()
+    _, status = os.waitpid(pid, 0)
+    httpclient.close()
+    assert os.WEXITSTATUS(status) == 0
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_compress_round_trip(encoding):
+    data = "[" + ",".join(['{"msg": "ACL send"}'] * 100) + "]"
+    body = httpclient.compress_body(data, encoding, 1)
+    assert len(body) < len(data)
+    assert httpclient.decompress_body(body, encoding) == data.encode()
+
+
+def test_decompress_errors():
+    assert httpclient.decompress_body(b"abc", None) == b"abc"
+    assert httpclient.decompress_body(b"abc", "identity") == b"abc"
+    with pytest.raises(ValueError):
+        httpclient.decompress_body(b"abc", "gzip")
+    with pytest.raises(ValueError):
+        httpclient.decompress_body(b"abc", "br")
+    with pytest.raises(ValueError):
+        httpclient.compress_body(b"abc", "br", 1)
+
+
+@pytest.fixture
+def receiver():
+    """
+    local server which rejects compressed bodies with its reject status (415) if its accept
+    attribute is False and records the decompressed bodies
+    """
+    class Receiver(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length')))
+            encoding = self.headers.get('Content-Encoding', None)
+            if encoding is not None and not server.accept:
+                status = server.reject
+            else:
+                server.bodies.append((encoding, httpclient.decompress_body(body, encoding)))
+                status = 201
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    Receiver.protocol_version = "HTTP/1.1"
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    server.accept = True
+    server.reject = 415
+    server.bodies = []
+    server.url = "http://127.0.0.1:"+str(server.server_address[1])+"/api/logging/0/list"
+    x = threading.Thread(target=server.serve_forever, daemon=True)
+    x.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    httpclient._reset()
+
+
+def test_post_compressed(receiver, monkeypatch):
+    monkeypatch.setattr(httpclient, "Compression", "gzip")
+    monkeypatch.setattr(httpclient, "CompressMin", 100)
+    data = "x" * 1000
+    assert httpclient.post(receiver.url, data, compress=True).status_code == 201
+    # small bodies and requests without compress are sent uncompressed
+    assert httpclient.post(receiver.url, "x" * 10, compress=True).status_code == 201
+    assert httpclient.post(receiver.url, data).status_code == 201
+    assert receiver.bodies == [("gzip", data.encode()), (None, b"x" * 10), (None, data.encode())]
+    stat = httpclient.stats()[receiver.url.split("/")[2]]
+    assert stat['compressed'] == 1
+    assert stat['raw_bytes'] == 1000
+    assert stat['compressed_bytes'] < 1000
+
+
+def test_post_fallback(receiver, monkeypatch):
+    monkeypatch.setattr(httpclient, "Compression", "gzip")
+    monkeypatch.setattr(httpclient, "CompressMin", 100)
+    receiver.accept = False
+    data = "x" * 1000
+    # the body is resent uncompressed and the host is not sent compressed bodies anymore
+    assert httpclient.post(receiver.url, data, compress=True).status_code == 201
+    assert httpclient.post(receiver.url, data, compress=True).status_code == 201
+    assert receiver.bodies == [(None, data.encode()), (None, data.encode())]
+    assert receiver.url.split("/")[2] in httpclient._uncompressed
+
+
+def test_post_bad_request(receiver, monkeypatch):
+    monkeypatch.setattr(httpclient, "Compression", "gzip")
+    monkeypatch.setattr(httpclient, "CompressMin", 100)
+    receiver.accept = False
+    receiver.reject = 400
+    # other errors are not taken as a rejection of the compression
+    assert httpclient.post(receiver.url, "x" * 1000, compress=True).status_code == 400
+    assert receiver.bodies == []
+    assert len(httpclient._uncompressed) == 0
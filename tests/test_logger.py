@@ -0,0 +1,126 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the aggregation and filtering of time series samples
+"""
+import queue
+import pytest
+from clonemapy import logger
+
+
+def test_parse_series_rules():
+    assert logger.parse_series_rules("") == []
+    assert logger.parse_series_rules(" grid.* = 1000:mean,max ; soc=500:last;") == [
+        ("grid.*", "1000:mean,max"), ("soc", "500:last")]
+
+
+def test_aggregate():
+    agg = logger.Aggregate(10.0)
+    for i in (3.0, -1.0, 4.0):
+        agg.add(i)
+    assert agg.value("min") == -1.0
+    assert agg.value("max") == 4.0
+    assert agg.value("mean") == 2.0
+    assert agg.value("last") == 4.0
+    assert agg.value("count") == 3.0
+
+
+@pytest.fixture
+def shipper(monkeypatch):
+    monkeypatch.setenv("CLONEMAP_TS_WINDOWS", "grid.*=1000:mean,max,median;soc=500:last")
+    monkeypatch.setenv("CLONEMAP_TS_DEADBAND", "grid.q=1;*=0.5")
+    monkeypatch.setenv("CLONEMAP_TS_FLUSH_INTERVAL", "250")
+    return logger.TimeSeriesShipper(0, queue.Queue())
+
+
+def samples(shipper: logger.TimeSeriesShipper, agentid: int, name: str) -> list:
+    col = shipper.series.get((agentid, name), ([], []))
+    return list(zip(col[0], col[1]))
+
+
+def test_rules(shipper):
+    # unknown functions are ignored and the first matching rule applies
+    assert shipper.rule("grid.p") == (1.0, ["mean", "max"], None)
+    assert shipper.rule("grid.q") == (1.0, ["mean", "max"], None)
+    assert shipper.rule("soc") == (0.5, ["last"], None)
+    assert shipper.rule("v") == (0, [], 0.5)
+
+
+def test_windows(shipper):
+    shipper.add(1, "grid.p", 10.25, 1.0)
+    shipper.add(1, "grid.p", 10.75, 3.0)
+    shipper.add(2, "grid.p", 10.5, 7.0)
+    assert shipper.buffered == 0
+    # a sample of the next window closes the window
+    shipper.add(1, "grid.p", 11.5, 5.0)
+    assert samples(shipper, 1, "grid.p.mean") == [(10.0, 2.0)]
+    assert samples(shipper, 1, "grid.p.max") == [(10.0, 3.0)]
+    shipper.add(1, "soc", 10.25, 0.5)
+    shipper.add(1, "soc", 10.5, 0.75)
+    assert samples(shipper, 1, "soc") == [(10.0, 0.5)]
+    # windows are closed one flush interval after their end
+    shipper.close_windows(11.2)
+    assert samples(shipper, 2, "grid.p.mean") == []
+    shipper.close_windows(11.25)
+    assert samples(shipper, 2, "grid.p.mean") == [(10.0, 7.0)]
+    assert samples(shipper, 1, "soc") == [(10.0, 0.5), (10.5, 0.75)]
+    assert samples(shipper, 1, "grid.p.max") == [(10.0, 3.0)]
+    shipper.close_windows()
+    assert samples(shipper, 1, "grid.p.max") == [(10.0, 3.0), (11.0, 5.0)]
+    assert len(shipper.windows) == 0
+    assert shipper.aggregated == 6
+
+
+def test_deadband(shipper):
+    for i, value in enumerate((1.0, 1.25, 1.5, 1.75, 0.5, 0.75)):
+        shipper.add(1, "v", float(i), value)
+    assert samples(shipper, 1, "v") == [(0.0, 1.0), (3.0, 1.75), (4.0, 0.5)]
+    assert shipper.suppressed == 3
+
+
+def test_max_samples(monkeypatch):
+    monkeypatch.setenv("CLONEMAP_TS_MAX_SAMPLES", "3")
+    shipper = logger.TimeSeriesShipper(0, queue.Queue())
+    for i in range(5):
+        shipper.add(1, "v", float(i), float(i))
+    assert shipper.buffered == 3
+    assert shipper.dropped == 2
@@ -0,0 +1,144 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the mailbox with selective receive
+"""
+import queue
+import threading
+import time
+import pytest
+import clonemapy.datamodels as datamodels
+from clonemapy.mailbox import Mailbox
+
+
+def new_msg(sender: int = 0, perf: int = 0, convid: int = None, content: str = "x"):
+    return datamodels.ACLMessage(sender=sender, perf=perf, receiver=1, convid=convid,
+                                 content=content)
+
+
+def test_fifo():
+    mb = Mailbox()
+    msgs = [new_msg(i) for i in range(5)]
+    for i in msgs:
+        mb.put(i)
+    assert len(mb) == 5
+    assert [mb.get() for i in range(5)] == msgs
+    with pytest.raises(queue.Empty):
+        mb.get(block=False)
+
+
+def test_selective_receive():
+    mb = Mailbox()
+    msgs = [new_msg(1, 6), new_msg(2, 6), new_msg(1, 7, 99), new_msg(2, 7)]
+    for i in msgs:
+        mb.put(i)
+    assert mb.recv({"sender": 2, "perf": 7}, 0) is msgs[3]
+    assert mb.recv({"convid": 99}, 0) is msgs[2]
+    assert mb.recv({"sender": 3}, 0) is None
+    assert mb.recv({"perf": 6}, 0) is msgs[0]
+    assert mb.recv(None, 0) is msgs[1]
+    assert len(mb) == 0
+    # the indices do not keep entries of removed messages
+    for i in mb._index.values():
+        assert len(i) == 0
+
+
+def test_recv_waits():
+    mb = Mailbox()
+    msg = new_msg(4)
+    timer = threading.Timer(0.05, mb.put, args=(msg,))
+    timer.start()
+    assert mb.recv({"sender": 4}, 5) is msg
+    timer.join()
+    assert mb.recv({"sender": 4}, 0.01) is None
+
+
+def test_limits():
+    mb = Mailbox(max_len=2)
+    mb.put(new_msg())
+    mb.put(new_msg())
+    with pytest.raises(queue.Full):
+        mb.put(new_msg(), block=False)
+    with pytest.raises(queue.Full):
+        mb.put(new_msg(), timeout=0.01)
+    mb.get()
+    mb.put(new_msg())
+    mb = Mailbox(max_bytes=10)
+    mb.put(new_msg(content="a" * 6))
+    with pytest.raises(queue.Full):
+        mb.put(new_msg(content="a" * 6), block=False)
+    mb.put(new_msg(content="a" * 4), block=False)
+    # an empty mailbox accepts messages larger than the limit
+    mb = Mailbox(max_bytes=10)
+    mb.put(new_msg(content="a" * 20), block=False)
+
+
+def test_blocked_put():
+    mb = Mailbox(max_len=1)
+    mb.put(new_msg(1))
+    timer = threading.Timer(0.05, mb.get)
+    timer.start()
+    mb.put(new_msg(2), timeout=5)
+    timer.join()
+    assert mb.get(block=False).sender == 2
+
+
+def test_eviction():
+    evicted = []
+    mb = Mailbox(max_age=0.05, on_evict=evicted.append)
+    mb.put(new_msg(1))
+    mb.put(new_msg(2))
+    time.sleep(0.1)
+    mb.put(new_msg(3))
+    assert evicted == [2]
+    assert mb.evicted == 2
+    assert mb.get(block=False).sender == 3
+
+
+def test_close():
+    mb = Mailbox()
+    timer = threading.Timer(0.05, mb.close)
+    timer.start()
+    assert mb.recv({"sender": 1}) is None
+    timer.join()
+    mb.put(new_msg())
+    assert len(mb) == 0
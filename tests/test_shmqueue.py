@@ -0,0 +1,121 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the shared memory queue
+"""
+import multiprocessing
+import queue
+import pytest
+from clonemapy import shmqueue
+
+pytestmark = pytest.mark.skipif(shmqueue.shared_memory is None,
+                                reason="shared memory requires python >= 3.8")
+
+
+@pytest.fixture
+def q():
+    q = shmqueue.ShmQueue(64)
+    yield q
+    q.close()
+
+
+def test_fifo(q):
+    q.put({"a": 1})
+    q.put("b")
+    assert q.get() == {"a": 1}
+    assert q.get_nowait() == "b"
+    assert q.empty()
+
+
+def test_wrap_around(q):
+    # the frames do not divide the capacity and wrap around the end of the ring
+    for i in range(20):
+        data = bytes([i]) * 13
+        q.put(data)
+        q.put(data)
+        assert q.get() == data
+        assert q.get() == data
+    assert q.qsize() == 0
+
+
+def test_full_and_empty(q):
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+    with pytest.raises(ValueError):
+        q.put(b"x" * 64)
+    num = 0
+    with pytest.raises(queue.Full):
+        while True:
+            q.put_nowait(b"x" * 10)
+            num += 1
+    assert num > 0
+    with pytest.raises(queue.Full):
+        q.put(b"x" * 10, timeout=0.01)
+    q.get()
+    q.put_nowait(b"x" * 10)
+
+
+def test_custom_codec():
+    q = shmqueue.ShmQueue(64, dumps=str.encode, loads=bytes.decode)
+    try:
+        q.put("abc")
+        assert q.get() == "abc"
+    finally:
+        q.close()
+
+
+def test_process():
+    ctx = multiprocessing.get_context("spawn")
+    q_in = shmqueue.ShmQueue(1024, ctx)
+    q_out = shmqueue.ShmQueue(1024, ctx)
+    proc = ctx.Process(target=shmqueue._echo, args=(q_in, q_out))
+    proc.start()
+    try:
+        for i in range(100):
+            q_in.put(i)
+        for i in range(100):
+            assert q_out.get(timeout=10) == i
+    finally:
+        q_in.put(None)
+        proc.join(10)
+        q_in.close()
+        q_out.close()
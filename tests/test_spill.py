@@ -0,0 +1,111 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the spill buffer
+"""
+import os
+from clonemapy.spill import SpillBuffer
+
+
+def test_fifo(tmp_path):
+    buf = SpillBuffer(str(tmp_path), segment_size=64)
+    for i in range(10):
+        assert buf.append(b"record" + str(i).encode())
+    assert len(buf) == 10
+    for i in range(10):
+        assert buf.peek() == b"record" + str(i).encode()
+        buf.pop()
+    assert buf.peek() is None
+    assert buf.stats()['replayed'] == 10
+
+
+def test_reload(tmp_path):
+    buf = SpillBuffer(str(tmp_path), segment_size=64)
+    for i in range(5):
+        buf.append(bytes([i]) * 10)
+    assert buf.peek() == bytes([0]) * 10
+    buf.pop()
+    buf.close()
+    buf = SpillBuffer(str(tmp_path), segment_size=64)
+    assert len(buf) == 4
+    assert buf.peek() == bytes([1]) * 10
+    # records appended after reload follow the existing ones
+    buf.append(b"new")
+    records = []
+    while True:
+        data = buf.peek()
+        if data is None:
+            break
+        records.append(data)
+        buf.pop()
+    assert records == [bytes([i]) * 10 for i in range(1, 5)] + [b"new"]
+
+
+def test_drop_oldest(tmp_path):
+    buf = SpillBuffer(str(tmp_path), segment_size=64, quota=128, policy="drop-oldest")
+    for i in range(20):
+        assert buf.append(bytes([i]) * 20)
+    assert buf.disk_usage() <= 128
+    assert buf.dropped > 0
+    assert buf.dropped + len(buf) == 20
+    assert buf.peek() == bytes([buf.dropped]) * 20
+    assert len([i for i in os.listdir(str(tmp_path)) if i.endswith(".seg")]) <= 2
+
+
+def test_drop_newest(tmp_path):
+    buf = SpillBuffer(str(tmp_path), segment_size=64, quota=128, policy="drop-newest")
+    results = [buf.append(bytes([i]) * 20) for i in range(20)]
+    assert not results[-1]
+    assert buf.dropped == results.count(False)
+    assert buf.peek() == bytes([0]) * 20
+
+
+def test_pop_after_drop(tmp_path):
+    buf = SpillBuffer(str(tmp_path), segment_size=64, quota=64, policy="drop-oldest")
+    buf.append(b"a" * 20)
+    buf.append(b"b" * 20)
+    assert buf.peek() == b"a" * 20
+    # the segment holding the peeked record is dropped to make room
+    buf.append(b"c" * 40)
+    buf.pop()
+    assert buf.peek() == b"c" * 40
+    assert buf.replayed == 0
@@ -0,0 +1,82 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+tests of the binary encoding of ACL messages
+"""
+from datetime import datetime, timezone
+import pytest
+import clonemapy.datamodels as datamodels
+import clonemapy.wire as wire
+
+
+def test_round_trip():
+    msgs = [
+        datamodels.ACLMessage(ts=datetime(2021, 3, 4, 5, 6, 7, 891011), perf=6, sender=3,
+                              agencys="agency-0", receiver=17, agencyr="agency-1",
+                              content="température 21.5", prot=2),
+        datamodels.ACLMessage(ts=datetime(2021, 3, 4, 5, 6, 7, tzinfo=timezone.utc), receiver=0,
+                              content="", repto=5, convid=-42, lang="json", inrepto="x"),
+    ]
+    decoded = wire.decode_msgs(wire.encode_msgs(msgs))
+    assert len(decoded) == 2
+    for i in range(2):
+        assert decoded[i].dict() == msgs[i].dict()
+
+
+def test_optional_fields():
+    msg = datamodels.ACLMessage(receiver=1, content="a")
+    decoded = wire.decode_msg(wire.encode_msg(msg))
+    assert decoded.repto is None
+    assert decoded.convid is None
+    assert decoded.lang is None
+    assert decoded.ts == msg.ts
+
+
+def test_empty_list():
+    assert wire.decode_msgs(wire.encode_msgs([])) == []
+
+
+def test_unknown_version():
+    data = bytearray(wire.encode_msg(datamodels.ACLMessage(receiver=1, content="a")))
+    data[0] = 99
+    with pytest.raises(ValueError):
+        wire.decode_msg(bytes(data))